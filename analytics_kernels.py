@@ -0,0 +1,48 @@
+import numpy as np
+from numba import njit, prange
+
+
+@njit(cache=True)
+def trend_counts(tag_ptr, tag_idx, target_pos, period_ids, n_targets, n_periods):
+    """Матрица (целевой тег, период) по тегам звонков в CSR-виде.
+
+    Теги i-го звонка - tag_idx[tag_ptr[i]:tag_ptr[i + 1]], target_pos
+    переводит номер тега словаря в номер целевого тега (-1 - не целевой).
+    """
+    out = np.zeros((n_targets, n_periods), dtype=np.int64)
+    for i in range(period_ids.shape[0]):
+        p = period_ids[i]
+        for j in range(tag_ptr[i], tag_ptr[i + 1]):
+            t = target_pos[tag_idx[j]]
+            if t >= 0:
+                out[t, p] += 1
+    return out
+
+
+@njit(parallel=True, cache=True)
+def frame_stats(y, frame_length, hop_length):
+    """Кадровая RMS и доля пересечений нуля сигнала за один проход по y.
+
+    Кадры берутся так же, как sliding_window_view(y, frame_length)[::hop_length].
+    """
+    n_frames = (y.shape[0] - frame_length) // hop_length + 1
+    rms = np.empty(n_frames, dtype=np.float32)
+    for i in prange(n_frames):
+        start = i * hop_length
+        acc = 0.0
+        for j in range(start, start + frame_length):
+            acc += y[j] * y[j]
+        rms[i] = np.sqrt(acc / frame_length)
+
+    crossings = 0
+    for k in prange(1, y.shape[0]):
+        if np.signbit(y[k - 1]) != np.signbit(y[k]):
+            crossings += 1
+    return rms, crossings / (y.shape[0] - 1)
+
+
+def warmup():
+    """Компилирует ядра заранее, чтобы первый запрос не ждал JIT"""
+    ids = np.zeros(1, dtype=np.int32)
+    trend_counts(np.zeros(2, dtype=np.int32), ids, ids, ids, 1, 1)
+
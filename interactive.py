@@ -5,7 +5,7 @@ from datetime import datetime
 from mcp_orchestrator import JSONCallAnalyticsMCP
 
 
-def enhanced_interactive_mode(_model: str):
+def enhanced_interactive_mode(_model: str, planner_model: str = None, backend: str = 'list'):
     """Расширенный интерактивный режим с командами и историей"""
 
 
@@ -23,7 +23,13 @@ def enhanced_interactive_mode(_model: str):
         print("Сначала добавьте JSON файлы в директорию")
         return
 
-    system = JSONCallAnalyticsMCP(JSON_DIRECTORY, _model)
+    # Предкомпиляция аналитических ядер, чтобы первый запрос не ждал JIT
+    if os.environ.get('CALLS_NUMBA_WARMUP', '') not in ('', '0'):
+        from analytics_kernels import warmup
+        print("⚙️  Компиляция аналитических ядер...")
+        warmup()
+
+    system = JSONCallAnalyticsMCP(JSON_DIRECTORY, _model, planner_model, backend)
 
     # История запросов
     query_history = []
@@ -1,12 +1,22 @@
-import ollama
+import asyncio
 import re
+import sys
 from dateutil import parser
 import sqlite3
 from datetime import datetime, timedelta
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Optional, Tuple
 import json
 from dataclasses import dataclass
 from enum import Enum
+from functools import lru_cache
+
+
+# Параметры генерации планировщика: план - короткий JSON, поэтому
+# ограничиваем длину ответа и контекст размером промпта
+PLANNER_OPTIONS = {'temperature': 0.1, 'num_predict': 256, 'num_ctx': 2048, 'num_batch': 512}
+
+# Порог времени генерации плана, после которого выводим предупреждение
+SLOW_PLAN_EVAL_SEC = 1.0
 
 
 # Структуры данных
@@ -21,6 +31,10 @@ class CallRecord:
     duration_sec: int
     customer_id: str
 
+    def __post_init__(self):
+        # Теги повторяются во всех звонках: храним одну копию каждой строки
+        self.tags = [sys.intern(tag) for tag in self.tags]
+
 
 class MetricType(Enum):
     """Типы метрик для анализа"""
@@ -41,15 +55,47 @@ class AnalysisPlan:
     comparison_tags: List[str] = None  # Для сравнения
     additional_filters: Dict = None  # Доп. фильтры
 
-class DeepSeekPlanner:
+
+class TagMatcher:
+    """Сопоставление тегов из ответа модели со списком available_tags"""
+
+    def _init_tag_matcher(self):
+        # Теги в нижнем регистре считаются один раз, а не на каждое сравнение
+        self._available_lc = tuple((tag, tag.lower()) for tag in self.available_tags)
+        self._tag_matches = {}
+
+    def _match_available_tag(self, tag: str) -> Optional[str]:
+        """Первый доступный тег, совпадающий по подстроке без учета регистра"""
+        if tag in self._tag_matches:
+            return self._tag_matches[tag]
+
+        tag_lc = tag.lower()
+        hit = None
+        for available_tag, available_lc in self._available_lc:
+            if tag_lc in available_lc or available_lc in tag_lc:
+                hit = available_tag
+                break
+
+        # Планировщик разделяется между запросами, модель повторяет одни и те же теги
+        self._tag_matches[tag] = hit
+        return hit
+
+
+class DeepSeekPlanner(TagMatcher):
     """LLM, которая преобразует запрос пользователя в план анализа"""
 
     def __init__(self, model_name):
+        # Импорт здесь: AnalysisPlan/MetricType импортируются для типизации
+        # без загрузки клиента Ollama
+        import ollama
+
         self.client = ollama.Client()
+        self.async_client = None  # Создается при первом пакетном запросе
         self.model_name = model_name
 
-        # Доступные теги из вашей базы
-        self.available_tags = [
+        # Доступные теги из вашей базы. Кортеж неизменяемый: экземпляр
+        # планировщика разделяется между запросами (см. get_planner)
+        self.available_tags = (
             "жалоба_качество_стирки",
             "жалоба_долгая_доставка",
             "жалоба_повреждение_изделия",
@@ -61,7 +107,46 @@ class DeepSeekPlanner:
             "срочный_вопрос",
             "перенос_доставки",
             "отмена_заказа"
-        ]
+        )
+        self.available_tags = tuple(sys.intern(tag) for tag in self.available_tags)
+
+        # Точное совпадение тега -> каноническая (интернированная) строка
+        self._tag_index = {tag: tag for tag in self.available_tags}
+
+        self._init_tag_matcher()
+
+        # JSON-схема плана для ограниченной генерации: модель не может выйти
+        # за пределы структуры и выбрать тег не из списка
+        self.plan_schema = self._build_plan_schema()
+
+    def _build_plan_schema(self) -> Dict[str, Any]:
+        """JSON-схема ответа планировщика"""
+        tag_list = {'type': 'array', 'items': {'type': 'string', 'enum': list(self.available_tags)}}
+
+        return {
+            'type': 'object',
+            'properties': {
+                'time_period': {
+                    'type': 'object',
+                    'properties': {
+                        'type': {'type': 'string', 'enum': ['relative', 'absolute']},
+                        'start': {'type': ['string', 'null']},
+                        'end': {'type': ['string', 'null']},
+                        'description': {'type': 'string'}
+                    },
+                    'required': ['type', 'start', 'end', 'description']
+                },
+                'target_tags': tag_list,
+                'metrics': {
+                    'type': 'array',
+                    'items': {'type': 'string', 'enum': [m.value for m in MetricType]}
+                },
+                'grouping': {'type': 'string', 'enum': ['month', 'week', 'day']},
+                'comparison_tags': tag_list,
+                'filters': {'type': 'object'}
+            },
+            'required': ['time_period', 'target_tags', 'metrics', 'grouping']
+        }
 
     def create_analysis_plan(self, user_query: str) -> AnalysisPlan:
         """Преобразует запрос пользователя в план анализа"""
@@ -71,13 +156,42 @@ class DeepSeekPlanner:
         response = self.client.generate(
             model=self.model_name,
             prompt=prompt,
-            format="json",
-            options={'temperature': 0.1, 'num_predict': 500}
+            format=self.plan_schema,
+            options=PLANNER_OPTIONS
         )
 
+        return self._plan_from_response(response)
+
+    async def create_analysis_plans(self, user_queries: List[str]) -> List[AnalysisPlan]:
+        """Строит планы для пачки запросов параллельно.
+
+        Запросы уходят на сервер Ollama одновременно, и он обрабатывает
+        их одним батчем на GPU.
+        """
+        if self.async_client is None:
+            import ollama
+            self.async_client = ollama.AsyncClient()
+
+        responses = await asyncio.gather(*[
+            self.async_client.generate(
+                model=self.model_name,
+                prompt=self._build_planner_prompt(user_query),
+                format=self.plan_schema,
+                options=PLANNER_OPTIONS
+            )
+            for user_query in user_queries
+        ])
+
+        return [self._plan_from_response(response) for response in responses]
+
+    def _plan_from_response(self, response) -> AnalysisPlan:
+        """Преобразует ответ LLM в AnalysisPlan"""
+        eval_sec = response.get('eval_duration', 0) / 1e9
+        if eval_sec > SLOW_PLAN_EVAL_SEC:
+            print(f"⚠️  Медленная генерация плана: {eval_sec:.2f} сек ({self.model_name})")
+
         plan_data = json.loads(response['response'])
 
-        # Преобразуем в AnalysisPlan
         return AnalysisPlan(
             time_period=self._parse_time_period(plan_data.get('time_period', {})),
             target_tags=self._validate_tags(plan_data.get('target_tags', [])),
@@ -159,22 +273,35 @@ class DeepSeekPlanner:
             start_str = period_data.get('start')
             end_str = period_data.get('end')
 
-            start = parser.parse(start_str) if start_str else today - timedelta(days=30)
-            end = parser.parse(end_str) if end_str else today
+            start = self._parse_date(start_str) if start_str else today - timedelta(days=30)
+            end = self._parse_date(end_str) if end_str else today
 
         return {'start': start, 'end': end}
 
+    @staticmethod
+    def _parse_date(value: str) -> datetime:
+        """Дата из ответа LLM: быстрый путь для YYYY-MM-DD, иначе dateutil"""
+        try:
+            return datetime.strptime(value, "%Y-%m-%d")
+        except ValueError:
+            return parser.parse(value)
+
     def _validate_tags(self, tags: List[str]) -> List[str]:
         """Проверяет, что теги есть в доступных"""
         valid_tags = []
         for tag in tags:
-            # Проверяем точное совпадение или частичное
-            for available_tag in self.available_tags:
-                if tag.lower() in available_tag.lower() or available_tag.lower() in tag.lower():
-                    valid_tags.append(available_tag)
-                    break
+            # При генерации по схеме теги совпадают точно
+            canonical = self._tag_index.get(tag)
+            if canonical is not None:
+                valid_tags.append(canonical)
+                continue
 
-        return valid_tags or self.available_tags[:1]  # Fallback
+            # Иначе ищем частичное совпадение
+            available_tag = self._match_available_tag(tag)
+            if available_tag is not None:
+                valid_tags.append(available_tag)
+
+        return valid_tags or list(self.available_tags[:1])  # Fallback
 
     def _parse_metrics(self, metrics: List[str]) -> List[MetricType]:
         """Парсит метрики из строк в enum"""
@@ -191,4 +318,10 @@ class DeepSeekPlanner:
             if metric in metric_map:
                 result.append(metric_map[metric])
 
-        return result or [MetricType.COUNT_BY_TAG]
\ No newline at end of file
+        return result or [MetricType.COUNT_BY_TAG]
+
+
+@lru_cache(maxsize=4)
+def get_planner(model_name: str, planner_cls: type = DeepSeekPlanner):
+    """Возвращает общий экземпляр планировщика для модели (клиент Ollama создается один раз)"""
+    return planner_cls(model_name)
@@ -1,6 +1,4 @@
 import argparse
-from interactive import enhanced_interactive_mode
-from mcp_orchestrator import JSONCallAnalyticsMCP
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='MCP система анализа телефонных звонков')
@@ -11,13 +9,21 @@ if __name__ == "__main__":
                         help='Путь к JSON файлам')
     parser.add_argument('--model', default='mistral-nemo:12b',  #'qwen2.5:14b', deepseek-coder:6.7b, deepseek-coder:33b
                         help='Модель Ollama')
+    parser.add_argument('--planner-model', default='qwen2.5:3b-instruct-q4_K_M',
+                        help='Модель Ollama для планировщика запросов')
+    parser.add_argument('--backend', default='list', choices=['list', 'sqlite'],
+                        help='Хранение звонков: список в памяти или только in-memory SQLite')
     parser.add_argument('--telegram-token',
                         help='Токен Telegram бота (для режима telegram)')
 
     args = parser.parse_args()
 
+    # Зависимости режимов импортируются внутри веток, чтобы --help
+    # и другие режимы не загружали лишнего
     if args.mode == 'interactive':
-        enhanced_interactive_mode(args.model)
+        from interactive import enhanced_interactive_mode
+
+        enhanced_interactive_mode(args.model, args.planner_model, args.backend)
 
     # elif args.mode == 'web':
     #     from api_server import run_api_server
@@ -41,5 +47,7 @@ if __name__ == "__main__":
 
     elif args.mode == 'test':
         # Тестовый режим
-        system = JSONCallAnalyticsMCP(args.json_dir, args.model)
+        from mcp_orchestrator import JSONCallAnalyticsMCP
+
+        system = JSONCallAnalyticsMCP(args.json_dir, args.model, args.planner_model, args.backend)
         system.test_system()
\ No newline at end of file
@@ -1,14 +1,68 @@
+import hashlib
 import json
 import os
 import re
+import sys
 from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 from dataclasses import dataclass, asdict
 from enum import Enum
 import ollama
 from collections import defaultdict, Counter
 import sqlite3
+import threading
+import weakref
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
+from functools import reduce
+from itertools import chain, islice
+from operator import or_
+
+from llm_query_planner import PLANNER_OPTIONS, SLOW_PLAN_EVAL_SEC, TagMatcher, get_planner
+
+try:
+    import numpy as np
+except ImportError:  # Без NumPy работает построчный путь
+    np = None
+
+try:
+    import orjson
+except ImportError:  # Без orjson используется стандартный json
+    orjson = None
+
+try:
+    import simdjson
+except ImportError:  # Без simdjson файлы разбираются стандартным json
+    simdjson = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # Без pyarrow кэш корпуса не используется
+    pa = None
+
+try:
+    from analytics_kernels import trend_counts
+except ImportError:  # Без Numba динамика тегов считается построчно
+    trend_counts = None
+
+# Размер пакета строк при загрузке звонков в SQLite
+SQL_INSERT_CHUNK = 1000
+
+
+def _json_loads(data):
+    """Разбор JSON через orjson, если он установлен"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _json_dumps(obj) -> str:
+    """Сериализация в JSON-строку без экранирования кириллицы"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(obj, ensure_ascii=False, default=str)
 
 
 # ==================== Структуры данных ====================
@@ -44,96 +98,350 @@ class AnalysisPlan:
         }
 
 
+# ==================== Колоночное представление ====================
+
+class JSONCallColumns:
+    """Колоночное (SoA) представление загруженных звонков.
+
+    Звонки отсортированы по дате, поэтому фильтр по периоду - это
+    двоичный поиск в dates. Теги хранятся в CSR-виде: теги i-го звонка -
+    tag_idx[tag_ptr[i]:tag_ptr[i + 1]], номера указывают в tag_vocab.
+    Если тегов в словаре не больше 64, теги звонка дополнительно
+    упакованы в маску uint64 (бит i - тег tag_vocab_lc[i]).
+    """
+
+    def __init__(self, calls: List[Dict]):
+        self.dates = np.array([call['call_date'] for call in calls], dtype='datetime64[us]')
+
+        vocab_index = {}
+        tag_ptr = np.zeros(len(calls) + 1, dtype=np.int32)
+        tag_idx = []
+        for i, call in enumerate(calls):
+            for tag_lc in call['tags_lc']:
+                tag_idx.append(vocab_index.setdefault(tag_lc, len(vocab_index)))
+            tag_ptr[i + 1] = len(tag_idx)
+
+        self.tag_ptr = tag_ptr
+        self.tag_idx = np.array(tag_idx, dtype=np.int32)
+        self.tag_vocab_lc = list(vocab_index)  # Теги в нижнем регистре по номеру
+
+        # Маска теряет повторы тега в звонке, поэтому строится только
+        # там, где подсчет по ней совпадает с подсчетом вхождений
+        self.tag_masks = None
+        if len(vocab_index) <= 64 and all(len(set(call['tags_lc'])) == len(call['tags_lc']) for call in calls):
+            self.tag_masks = np.fromiter(
+                (reduce(or_, (1 << vocab_index[tag_lc] for tag_lc in call['tags_lc']), 0) for call in calls),
+                dtype=np.uint64,
+                count=len(calls)
+            )
+
+    def period_bounds(self, start: datetime, end: datetime) -> Tuple[int, int]:
+        """Границы [lo, hi) звонков за период [start, end]"""
+        lo = int(np.searchsorted(self.dates, np.datetime64(start, 'us'), side='left'))
+        hi = int(np.searchsorted(self.dates, np.datetime64(end, 'us'), side='right'))
+        return lo, hi
+
+    def period_ids(self, lo: int, hi: int, grouping: str) -> Tuple[List[str], np.ndarray]:
+        """Ключи периодов и номер периода для каждого звонка [lo, hi)"""
+        dates = self.dates[lo:hi]
+        if grouping == 'month':
+            keys = np.datetime_as_string(dates, unit='M')
+        elif grouping == 'week':
+            days, day_ids = np.unique(dates.astype('datetime64[D]'), return_inverse=True)
+            day_keys = []
+            for day in days.astype(datetime):
+                year, week, _ = day.isocalendar()
+                day_keys.append(f"{year}-W{week:02d}")
+            keys = np.array(day_keys, dtype=str)[day_ids]
+        else:  # day
+            keys = np.datetime_as_string(dates, unit='D')
+
+        labels, ids = np.unique(keys, return_inverse=True)
+        return labels.tolist(), ids.astype(np.int32)
+
+    def mask_counts(self, lo: int, hi: int, target_masks: Dict[str, int]) -> Dict[str, int]:
+        """Количество звонков [lo, hi) с каждым битом маски, по целевым тегам"""
+        window = self.tag_masks[lo:hi]
+        counts = {}
+        for target, mask in target_masks.items():
+            count = 0
+            while mask:
+                bit = mask & -mask
+                count += int(np.count_nonzero(window & np.uint64(bit)))
+                mask ^= bit
+            counts[target] = count
+        return counts
+
+    def tag_counts(self, lo: int, hi: int) -> np.ndarray:
+        """Количество вхождений каждого тега словаря в звонках [lo, hi)"""
+        window = self.tag_idx[self.tag_ptr[lo]:self.tag_ptr[hi]]
+        return np.bincount(window, minlength=len(self.tag_vocab_lc))
+
+
 # ==================== JSON Data Loader ====================
 
+# Дата в имени файла: YYYY-MM-DD
+_DATE_RE = re.compile(r'(\d{4})-(\d{2})-(\d{2})')
+
+
+_parser_local = threading.local()
+
+
+def _thread_parser():
+    """simdjson.Parser текущего потока (парсер нельзя делить между потоками)"""
+    if simdjson is None:
+        return None
+    parser = getattr(_parser_local, 'parser', None)
+    if parser is None:
+        parser = _parser_local.parser = simdjson.Parser()
+    return parser
+
+
+def _read_call_fields(filepath: str, parser=None) -> Tuple[str, str, List[str]]:
+    """Читает из JSON звонка только текст, причину и теги.
+
+    С simdjson документ не превращается в словарь целиком: копируются
+    только нужные строки, остальное остается в буфере парсера до
+    следующего parse().
+    """
+    with open(filepath, 'rb') as f:
+        raw = f.read()
+
+    if parser is not None:
+        doc = parser.parse(raw)
+        tags = list(doc['tags'].get('fixed_tags', []))
+        return doc.get('text', ''), doc.get('reason', ''), tags
+
+    data = _json_loads(raw)
+    tags = data.get('tags').get('fixed_tags', [])
+    return data.get('text', ''), data.get('reason', ''), tags
+
+
+def _entries_manifest(entries: List[os.DirEntry]) -> str:
+    """Отпечаток набора файлов: имя, mtime и размер каждого"""
+    digest = hashlib.sha1()
+    for entry in entries:
+        stat = entry.stat()
+        digest.update(f"{entry.name}\0{stat.st_mtime_ns}\0{stat.st_size}\n".encode())
+    return digest.hexdigest()
+
+
 class JSONDataLoader:
     """Загружает и управляет данными из JSON файлов"""
 
-    def __init__(self, json_directory: str):
+    def __init__(self, json_directory: str, backend: str = 'list'):
+        if backend not in ('list', 'sqlite'):
+            raise ValueError(f"Неизвестный backend: {backend}")
+
         self.json_dir = json_directory
+        # 'list' - звонки в памяти списком словарей, 'sqlite' - только в
+        # in-memory SQLite (список не строится, метрики считаются SQL)
+        self.backend = backend
+        # Кэш разобранного корпуса рядом с директорией, а не в ней,
+        # чтобы файл кэша не попадал в список JSON
+        self.feather_path = os.path.normpath(json_directory) + '.calls.feather'
         self.calls_cache = None
+        self.date_keys = None  # Даты звонков из calls_cache, для bisect
+        self.columns = None  # JSONCallColumns, если доступен NumPy
         self.conn = None  # In-memory SQLite соединение
+        self._conn_finalizer = None  # Закрывает соединение при сборке загрузчика или на выходе
 
     def load_all_calls(self, limit: int = None) -> List[Dict]:
         """Загружает все звонки из JSON файлов"""
+        if self.backend == 'sqlite':
+            # Список не кэшируется: единственная копия данных - в SQLite
+            return list(islice(self.iter_calls(), limit))
+
         if self.calls_cache is not None:
             return self.calls_cache[:limit] if limit else self.calls_cache
 
-        all_calls = []
+        entries = self._json_entries()
+        if limit:
+            entries = entries[:limit]
+            manifest = None
+        else:
+            manifest = _entries_manifest(entries)
+            cached_calls = self._read_feather_cache(manifest)
+            if cached_calls is not None:
+                return self._set_calls_cache(cached_calls)
+
+        # Чтение файлов параллельно: ввод-вывод и разбор JSON не держат друг друга
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            parsed = executor.map(self._parse_one, entries)
+            all_calls = [call for call in parsed if call is not None]
+
+        for files_processed, call_record in enumerate(all_calls):
+            call_record['id'] = f"call_{files_processed}"
+
+        # Сортировка по дате: фильтр по периоду становится срезом
+        all_calls.sort(key=lambda call: call['call_date'])
+
+        if not limit:
+            self._write_feather_cache(all_calls, manifest)
+
+        return self._set_calls_cache(all_calls)
+
+    def count_calls(self) -> int:
+        """Общее количество звонков"""
+        if self.backend == 'sqlite':
+            with self.get_cursor() as cursor:
+                cursor.execute("SELECT COUNT(*) FROM calls")
+                return cursor.fetchone()[0]
+
+        return len(self.load_all_calls())
+
+    def get_full_text(self, call_id: str) -> str:
+        """Полный текст звонка: в кэше его нет, читается из исходного файла"""
+        if self.backend == 'sqlite':
+            with self.get_cursor() as cursor:
+                cursor.execute("SELECT source_file FROM calls WHERE id = ?", (call_id,))
+                row = cursor.fetchone()
+            source_file = row[0] if row else None
+        else:
+            source_file = next(
+                (call['source_file'] for call in self.load_all_calls() if call['id'] == call_id),
+                None
+            )
+
+        if source_file is None:
+            return ''
+
+        text, _, _ = _read_call_fields(source_file, _thread_parser())
+        return text
+
+    def _json_entries(self) -> List[os.DirEntry]:
+        """JSON файлы директории, отсортированные по имени"""
+        # DirEntry хранит путь и результат stat, лишних системных вызовов нет
+        return sorted(
+            (entry for entry in os.scandir(self.json_dir) if entry.name.endswith('.json')),
+            key=lambda entry: entry.name
+        )
+
+    def _iter_parsed_calls(self) -> Iterator[Dict]:
+        """Разбирает JSON файлы пачками, не накапливая весь корпус в памяти"""
+        entries = self._json_entries()
         files_processed = 0
 
-        for filename in sorted(os.listdir(self.json_dir)):
-            if not filename.endswith('.json'):
-                continue
-
-            filepath = os.path.join(self.json_dir, filename)
-
-            try:
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-
-                # Извлекаем дату из имени файла
-                call_date = self._extract_date_from_filename(filename)
-
-                # Формируем структурированную запись
-                call_record = {
-                    'id': f"call_{files_processed}",
-                    'file_name': filename,
-                    'call_date': call_date,
-                    'year': call_date.year,
-                    'month': call_date.month,
-                    'day': call_date.day,
-                    'full_text': data.get('text', ''),
-                    'summary': data.get('reason', ''),
-                    'tags': data.get('tags').get('fixed_tags', []),
-                    'text_length': len(data.get('text', '')),
-                    'source_file': filepath
-                }
-
-                all_calls.append(call_record)
-                files_processed += 1
-
-                if limit and files_processed >= limit:
-                    break
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            for i in range(0, len(entries), SQL_INSERT_CHUNK):
+                for call_record in executor.map(self._parse_one, entries[i:i + SQL_INSERT_CHUNK]):
+                    if call_record is None:
+                        continue
+                    call_record['id'] = f"call_{files_processed}"
+                    files_processed += 1
+                    yield call_record
+
+    def _parse_one(self, entry: os.DirEntry) -> Optional[Dict]:
+        """Разбирает один JSON файл звонка (None при ошибке)"""
+        try:
+            text, reason, tags = _read_call_fields(entry.path, _thread_parser())
+
+            # Извлекаем дату из имени файла
+            call_date = self._extract_call_date(entry)
+
+            # Формируем структурированную запись (id назначается после загрузки)
+            return {
+                'id': None,
+                'file_name': entry.name,
+                'call_date': call_date,
+                'year': call_date.year,
+                'month': call_date.month,
+                'day': call_date.day,
+                'iso_week': call_date.isocalendar()[:2],
+                'summary': reason,
+                'tags': tags,
+                # Нормализованные теги для сопоставления: приводим к нижнему
+                # регистру один раз при загрузке и интернируем
+                'tags_lc': tuple(sys.intern(tag.lower()) for tag in tags),
+                'text_length': len(text),
+                'source_file': entry.path
+            }
 
-            except Exception as e:
-                print(f"⚠️  Ошибка загрузки {filename}: {e}")
+        except Exception as e:
+            print(f"⚠️  Ошибка загрузки {entry.name}: {e}")
+            return None
 
+    def _set_calls_cache(self, all_calls: List[Dict]) -> List[Dict]:
+        """Сохраняет отсортированные по дате звонки в кэш"""
         self.calls_cache = all_calls
+        self.date_keys = [call['call_date'] for call in all_calls]
+        if np is not None:
+            self.columns = JSONCallColumns(all_calls)
         print(f"✅ Загружено {len(all_calls)} звонков из JSON файлов")
         return all_calls
 
-    def _extract_date_from_filename(self, filename: str) -> datetime:
-        """Извлекает дату из имени файла"""
-        # Паттерны для поиска даты в имени файла
-        patterns = [
-            r'(\d{4})-(\d{2})-(\d{2})',  # YYYY-MM-DD
-            # r'(\d{2})\.(\d{2})\.(\d{4})',  # DD.MM.YYYY
-            # r'(\d{4})(\d{2})(\d{2})',  # YYYYMMDD
-        ]
+    def _read_feather_cache(self, manifest: str) -> Optional[List[Dict]]:
+        """Читает корпус из Feather-кэша, если набор JSON файлов не менялся"""
+        if pa is None or not os.path.exists(self.feather_path):
+            return None
 
-        for pattern in patterns:
-            match = re.search(pattern, filename)
-            if match:
-                groups = match.groups()
-                if len(groups) == 3:
-                    if pattern == patterns[0]:  # YYYY-MM-DD
-                        year, month, day = map(int, groups)
-                        return datetime(year, month, day)
-                    elif pattern == patterns[1]:  # DD.MM.YYYY
-                        day, month, year = map(int, groups)
-                        return datetime(year, month, day)
-                    elif pattern == patterns[2]:  # YYYYMMDD
-                        year, month, day = int(groups[0]), int(groups[1]), int(groups[2])
-                        return datetime(year, month, day)
+        try:
+            table = feather.read_table(self.feather_path, memory_map=True)
+            # mtime директории не меняется при правке файла на месте -
+            # сверяем имя, mtime и размер каждого файла
+            metadata = table.schema.metadata or {}
+            if metadata.get(b'manifest') != manifest.encode():
+                return None
+
+            columns = {name: table.column(name).to_pylist() for name in table.column_names}
+        except Exception as e:
+            print(f"⚠️  Не удалось прочитать кэш {self.feather_path}: {e}")
+            return None
 
-        # Если дата не найдена, используем дату изменения файла
-        filepath = os.path.join(self.json_dir, filename)
-        if os.path.exists(filepath):
-            return datetime.fromtimestamp(os.path.getmtime(filepath))
+        all_calls = []
+        for i, call_date in enumerate(columns['call_date']):
+            tags = columns['tags'][i]
+            all_calls.append({
+                'id': columns['id'][i],
+                'file_name': columns['file_name'][i],
+                'call_date': call_date,
+                'year': call_date.year,
+                'month': call_date.month,
+                'day': call_date.day,
+                'iso_week': call_date.isocalendar()[:2],
+                'summary': columns['summary'][i],
+                'tags': tags,
+                'tags_lc': tuple(sys.intern(tag.lower()) for tag in tags),
+                'text_length': columns['text_length'][i],
+                'source_file': columns['source_file'][i]
+            })
+
+        print(f"📦 Корпус прочитан из кэша {self.feather_path}")
+        return all_calls
 
-        # Fallback: текущая дата
-        return datetime.now()
+    def _write_feather_cache(self, all_calls: List[Dict], manifest: str):
+        """Сохраняет нормализованный корпус в Feather для быстрой перезагрузки"""
+        if pa is None:
+            return
+
+        table = pa.Table.from_pydict({
+            'id': [call['id'] for call in all_calls],
+            'file_name': [call['file_name'] for call in all_calls],
+            'call_date': pa.array([call['call_date'] for call in all_calls], type=pa.timestamp('us')),
+            'summary': [call['summary'] for call in all_calls],
+            'tags': pa.array([call['tags'] for call in all_calls], type=pa.list_(pa.string())),
+            'text_length': pa.array([call['text_length'] for call in all_calls], type=pa.int64()),
+            'source_file': [call['source_file'] for call in all_calls],
+        }).replace_schema_metadata({b'manifest': manifest.encode()})
+
+        try:
+            feather.write_feather(table, self.feather_path, compression='zstd')
+        except Exception as e:
+            print(f"⚠️  Не удалось сохранить кэш {self.feather_path}: {e}")
+
+    def _extract_call_date(self, entry: os.DirEntry) -> datetime:
+        """Извлекает дату из имени файла"""
+        match = _DATE_RE.search(entry.name)
+        if match:
+            year, month, day = map(int, match.groups())
+            return datetime(year, month, day)
+
+        # Если дата не найдена, используем дату изменения файла
+        try:
+            return datetime.fromtimestamp(entry.stat().st_mtime)
+        except OSError:
+            # Fallback: текущая дата
+            return datetime.now()
 
     def setup_in_memory_db(self):
         """Создает in-memory SQLite базу для быстрых запросов"""
@@ -141,6 +449,17 @@ class JSONDataLoader:
             return self.conn
 
         self.conn = sqlite3.connect(':memory:')
+        # Финализатор держит только соединение, а не сам загрузчик
+        self._conn_finalizer = weakref.finalize(self, self.conn.close)
+
+        # База в памяти и пересобирается при каждом запуске:
+        # журнал и синхронизация не нужны
+        self.conn.executescript("""
+        PRAGMA journal_mode=OFF;
+        PRAGMA synchronous=OFF;
+        PRAGMA temp_store=MEMORY;
+        PRAGMA cache_size=-64000;
+        """)
         cursor = self.conn.cursor()
 
         # Создаем таблицы
@@ -152,10 +471,10 @@ class JSONDataLoader:
             year INTEGER,
             month INTEGER,
             day INTEGER,
-            full_text TEXT,
             summary TEXT,
             tags_json TEXT,
-            text_length INTEGER
+            text_length INTEGER,
+            source_file TEXT
         )
         """)
 
@@ -167,37 +486,82 @@ class JSONDataLoader:
         )
         """)
 
-        # Загружаем данные
-        calls = self.load_all_calls()
-        for call in calls:
-            cursor.execute("""
-            INSERT INTO calls (id, file_name, call_date, year, month, day, 
-                              full_text, summary, tags_json, text_length)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                call['id'],
-                call['file_name'],
-                call['call_date'].isoformat(),
-                call['year'],
-                call['month'],
-                call['day'],
-                call['full_text'],
-                call['summary'],
-                json.dumps(call['tags'], ensure_ascii=False),
-                call['text_length']
-            ))
-
-            # Вставляем теги
-            for tag in call['tags']:
-                cursor.execute(
-                    "INSERT INTO call_tags (call_id, tag) VALUES (?, ?)",
-                    (call['id'], tag)
+        # Загружаем данные пакетами одной транзакцией. Для backend='sqlite'
+        # звонки идут из разбора файлов сразу в базу, минуя список
+        calls = self._iter_parsed_calls() if self.backend == 'sqlite' else iter(self.load_all_calls())
+        calls_loaded = 0
+
+        cursor.execute("BEGIN")
+        for chunk in iter(lambda: list(islice(calls, SQL_INSERT_CHUNK)), []):
+            calls_rows = [
+                (
+                    call['id'],
+                    call['file_name'],
+                    call['call_date'].isoformat(),
+                    call['year'],
+                    call['month'],
+                    call['day'],
+                    call['summary'],
+                    _json_dumps(call['tags']),
+                    call['text_length'],
+                    call['source_file']
                 )
+                for call in chunk
+            ]
+            tag_rows = [(call['id'], tag) for call in chunk for tag in call['tags']]
 
+            cursor.executemany("INSERT INTO calls VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", calls_rows)
+            cursor.executemany("INSERT INTO call_tags (call_id, tag) VALUES (?, ?)", tag_rows)
+            calls_loaded += len(chunk)
         self.conn.commit()
-        print(f"✅ Данные загружены в in-memory SQLite ({len(calls)} записей)")
+
+        # Индексы строим после загрузки (так быстрее), затем собираем
+        # статистику для планировщика запросов SQLite
+        self.conn.executescript("""
+        CREATE INDEX idx_calls_date ON calls(call_date);
+        CREATE INDEX idx_tags_tag ON call_tags(tag);
+        CREATE INDEX idx_tags_call_tag ON call_tags(call_id, tag);
+        ANALYZE;
+        PRAGMA optimize;
+        """)
+        print(f"✅ Данные загружены в in-memory SQLite ({calls_loaded} записей)")
         return self.conn
 
+    def iter_calls(self, where_sql: str = '', params: tuple = ()) -> Iterator[Dict]:
+        """Звонки из SQLite в порядке даты, по одной записи.
+
+        where_sql - необязательное условие вида "WHERE call_date >= ?".
+        Используется отдельный курсор, чтобы во время обхода можно было
+        выполнять другие запросы через get_cursor.
+        """
+        if self.conn is None:
+            self.setup_in_memory_db()
+
+        rows = self.conn.execute(f"""
+        SELECT id, file_name, call_date, summary, tags_json, text_length, source_file
+        FROM calls
+        {where_sql}
+        ORDER BY call_date, rowid
+        """, params)
+
+        for call_id, file_name, call_date, summary, tags_json, text_length, source_file in rows:
+            call_date = datetime.fromisoformat(call_date)
+            tags = _json_loads(tags_json)
+            yield {
+                'id': call_id,
+                'file_name': file_name,
+                'call_date': call_date,
+                'year': call_date.year,
+                'month': call_date.month,
+                'day': call_date.day,
+                'iso_week': call_date.isocalendar()[:2],
+                'summary': summary,
+                'tags': tags,
+                'tags_lc': tuple(sys.intern(tag.lower()) for tag in tags),
+                'text_length': text_length,
+                'source_file': source_file
+            }
+
     @contextmanager
     def get_cursor(self):
         """Контекстный менеджер для курсора"""
@@ -210,10 +574,20 @@ class JSONDataLoader:
         finally:
             cursor.close()
 
+    def close(self):
+        """Закрывает соединение. PRAGMA optimize не нужен: база в памяти
+        и пересобирается при каждом запуске"""
+        if self.conn is None:
+            return
+
+        self._conn_finalizer()
+        self.conn = None
+        self._conn_finalizer = None
+
 
 # ==================== DeepSeek Planner ====================
 
-class DeepSeekPlanner:
+class DeepSeekPlanner(TagMatcher):
     """LLM планировщик запросов"""
 
     def __init__(self, model_name):
@@ -221,10 +595,13 @@ class DeepSeekPlanner:
         self.model_name = model_name
         self.available_tags = self._load_available_tags()
 
-    def _load_available_tags(self) -> List[str]:
+        self._init_tag_matcher()
+
+    def _load_available_tags(self) -> Tuple[str, ...]:
         """Загружает все уникальные теги из JSON файлов (для примера)"""
-        # В реальности нужно загрузить из данных
-        return [
+        # В реальности нужно загрузить из данных.
+        # Кортеж неизменяемый: планировщик разделяется между запросами (см. get_planner)
+        return (
             "низкое_качество_стирки_или_чистки",
             "не_заменили_ковры_вовремя",
             "клиент_хочет_добавить_ковры",
@@ -249,7 +626,7 @@ class DeepSeekPlanner:
             "клиент_уходит_к_конкурентам",
             "приостановить_услуги",
             "ошибка_в_документах"
-        ]
+        )
 
     def create_analysis_plan(self, user_query: str) -> AnalysisPlan:
         """Создает план анализа на основе запроса пользователя"""
@@ -261,10 +638,14 @@ class DeepSeekPlanner:
                 model=self.model_name,
                 prompt=prompt,
                 format="json",
-                options={'temperature': 0.1, 'num_predict': 500}
+                options=PLANNER_OPTIONS
             )
 
-            plan_data = json.loads(response['response'])
+            eval_sec = response.get('eval_duration', 0) / 1e9
+            if eval_sec > SLOW_PLAN_EVAL_SEC:
+                print(f"⚠️  Медленная генерация плана: {eval_sec:.2f} сек ({self.model_name})")
+
+            plan_data = _json_loads(response['response'])
 
             # Парсим временной период
             time_period = self._parse_time_period(plan_data.get('time_period', {}))
@@ -364,10 +745,9 @@ class DeepSeekPlanner:
         valid_tags = []
         for tag in tags:
             # Ищем похожие теги
-            for available_tag in self.available_tags:
-                if tag.lower() in available_tag.lower() or available_tag.lower() in tag.lower():
-                    valid_tags.append(available_tag)
-                    break
+            available_tag = self._match_available_tag(tag)
+            if available_tag is not None:
+                valid_tags.append(available_tag)
 
         return valid_tags or ['жалоба_качество_стирки']  # Fallback
 
@@ -415,32 +795,50 @@ class DeepSeekPlanner:
 class JSONQueryExecutor:
     """Выполняет аналитические запросы к JSON данным"""
 
-    def __init__(self, data_loader: JSONDataLoader):
+    def __init__(self, data_loader: JSONDataLoader, use_sql: bool = False):
         self.data_loader = data_loader
+        # Считать метрики запросами к in-memory SQLite вместо обхода списка;
+        # при backend='sqlite' списка нет, и SQL - единственный путь
+        self.use_sql = use_sql or data_loader.backend == 'sqlite'
 
     def execute_plan(self, plan: AnalysisPlan) -> Dict[str, Any]:
         """Выполняет план анализа"""
 
+        if self.use_sql:
+            return self._execute_plan_sql(plan)
+
         results = {}
 
         # Получаем данные за период
         all_calls = self.data_loader.load_all_calls()
         print(f'{len(all_calls)} calls in total')
         print(all_calls[:2])
-        filtered_calls = self._filter_calls_by_period(all_calls, plan.time_period)
+        columns = self.data_loader.columns
+        lo, hi = self._period_bounds(plan.time_period)
+        filtered_calls = all_calls[lo:hi]
         print(f'{len(filtered_calls)} calls after filtering')
 
         # Выполняем метрики
         for metric in plan.metrics:
             if metric == MetricType.COUNT_BY_TAG:
-                results['count_by_tag'] = self._count_by_tag(filtered_calls, plan.target_tags)
+                if columns is not None:
+                    results['count_by_tag'] = self._count_by_tag_columns(columns, lo, hi, plan.target_tags)
+                else:
+                    results['count_by_tag'] = self._count_by_tag(filtered_calls, plan.target_tags)
 
             elif metric == MetricType.TAG_TRENDS:
-                results['tag_trends'] = self._tag_trends(
-                    filtered_calls,
-                    plan.target_tags,
-                    plan.grouping
-                )
+                if columns is not None and trend_counts is not None:
+                    results['tag_trends'] = self._tag_trends_columns(
+                        columns, lo, hi,
+                        plan.target_tags,
+                        plan.grouping
+                    )
+                else:
+                    results['tag_trends'] = self._tag_trends(
+                        filtered_calls,
+                        plan.target_tags,
+                        plan.grouping
+                    )
 
             elif metric == MetricType.TOP_N_TAGS:
                 results['top_n_tags'] = self._top_n_tags(filtered_calls, n=5)
@@ -462,30 +860,225 @@ class JSONQueryExecutor:
 
         return results
 
-    def _filter_calls_by_period(self, calls: List[Dict], period: Dict) -> List[Dict]:
-        """Фильтрует звонки по временному периоду"""
-        start_date = period['start']
-        end_date = period['end']
+    def _execute_plan_sql(self, plan: AnalysisPlan) -> Dict[str, Any]:
+        """Выполняет план через индексированные запросы к in-memory SQLite"""
+        results = {}
 
-        filtered = []
-        for call in calls:
-            call_date = call['call_date']
-            if start_date <= call_date <= end_date:
-                filtered.append(call)
+        start_iso = plan.time_period['start'].isoformat()
+        end_iso = plan.time_period['end'].isoformat()
+        total_calls = self._sql_total_calls(start_iso, end_iso)
+        print(f'{total_calls} calls after filtering')
+
+        # Количество и динамика по тегам считаются одним запросом
+        period_counts = None
+        if MetricType.COUNT_BY_TAG in plan.metrics or MetricType.TAG_TRENDS in plan.metrics:
+            period_counts = self._sql_tag_period_counts(start_iso, end_iso, plan.target_tags, plan.grouping)
+
+        for metric in plan.metrics:
+            if metric == MetricType.COUNT_BY_TAG:
+                counts = defaultdict(int)
+                for (target, _), count in period_counts.items():
+                    counts[target] += count
+                results['count_by_tag'] = dict(counts)
+
+            elif metric == MetricType.TAG_TRENDS:
+                trends = defaultdict(list)
+                for (target, period), count in sorted(period_counts.items(), key=lambda item: item[0][1]):
+                    trends[target].append({'period': period, 'count': count})
+                results['tag_trends'] = dict(trends)
+
+            elif metric == MetricType.TOP_N_TAGS:
+                results['top_n_tags'] = self._sql_top_n_tags(start_iso, end_iso, n=5)
+
+            elif metric == MetricType.COMPARISON:
+                tags = plan.comparison_tags or plan.target_tags[:2]
+                if len(tags) < 2:
+                    tags = tags + [None] * (2 - len(tags))
+                counts = self._sql_count_by_tag(start_iso, end_iso, [t for t in tags[:2] if t])
+                results['comparison'] = self._comparison_result(tags, counts, total_calls)
+
+        results['summary_stats'] = {
+            'total_calls': total_calls,
+            'period': plan.time_period['description'],
+            'date_range': f"{plan.time_period['start'].strftime('%Y-%m-%d')} - {plan.time_period['end'].strftime('%Y-%m-%d')}"
+        }
+
+        return results
+
+    def _resolve_target_tags(self, target_tags: List[str]) -> Dict[str, str]:
+        """Сопоставляет теги из данных целевым тегам плана: {тег в данных: целевой тег}.
+
+        Правило то же, что и при обходе списка (вхождение подстроки в любую
+        сторону, первый подходящий целевой тег), но применяется один раз к
+        уникальным тегам, а не к каждому звонку.
+        """
+        with self.data_loader.get_cursor() as cursor:
+            cursor.execute("SELECT DISTINCT tag FROM call_tags")
+            data_tags = [row[0] for row in cursor.fetchall()]
+
+        match = self._tag_matcher(target_tags)
+        mapping = {}
+        for tag in data_tags:
+            target = match(tag.lower())
+            if target is not None:
+                mapping[tag] = target
+
+        return mapping
+
+    def _sql_total_calls(self, start_iso: str, end_iso: str) -> int:
+        """Количество звонков за период (по индексу даты)"""
+        with self.data_loader.get_cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM calls WHERE call_date BETWEEN ? AND ?", (start_iso, end_iso))
+            return cursor.fetchone()[0]
+
+    def _sql_tag_period_counts(self, start_iso: str, end_iso: str, target_tags: List[str],
+                               grouping: str) -> Dict[tuple, int]:
+        """Счетчики (целевой тег, период) за период одним запросом"""
+        mapping = self._resolve_target_tags(target_tags)
+        if not mapping:
+            return {}
+
+        # call_date хранится в ISO-формате: месяц и день - префиксы строки.
+        # ISO-неделю SQLite не считает, поэтому группируем по дням
+        # и сворачиваем дни в недели ниже (дней в выборке немного)
+        period_expr = 'substr(c.call_date, 1, 7)' if grouping == 'month' else 'substr(c.call_date, 1, 10)'
+
+        placeholders = ', '.join('?' * len(mapping))
+        with self.data_loader.get_cursor() as cursor:
+            cursor.execute(f"""
+            SELECT {period_expr} AS period, ct.tag, COUNT(*)
+            FROM call_tags ct
+            JOIN calls c ON ct.call_id = c.id
+            WHERE c.call_date BETWEEN ? AND ?
+            AND ct.tag IN ({placeholders})
+            GROUP BY period, ct.tag
+            """, (start_iso, end_iso, *mapping))
+            rows = cursor.fetchall()
 
-        return filtered
+        counts = defaultdict(int)
+        for period, tag, count in rows:
+            if grouping == 'week':
+                year, week, _ = datetime.fromisoformat(period).isocalendar()
+                period = f"{year}-W{week:02d}"
+            counts[(mapping[tag], period)] += count
+
+        return dict(counts)
+
+    def _sql_top_n_tags(self, start_iso: str, end_iso: str, n: int = 5) -> List[Dict]:
+        """Топ-N тегов за период"""
+        # При равенстве - порядок первого появления, как у Counter.most_common
+        with self.data_loader.get_cursor() as cursor:
+            cursor.execute("""
+            SELECT ct.tag, COUNT(*) AS count
+            FROM call_tags ct
+            JOIN calls c ON ct.call_id = c.id
+            WHERE c.call_date BETWEEN ? AND ?
+            GROUP BY ct.tag
+            ORDER BY count DESC, MIN(ct.rowid)
+            LIMIT ?
+            """, (start_iso, end_iso, n))
+            rows = cursor.fetchall()
+
+        return [{'tag': tag, 'count': count} for tag, count in rows]
+
+    def _sql_count_by_tag(self, start_iso: str, end_iso: str, target_tags: List[str]) -> Dict[str, int]:
+        """Подсчет звонков по тегам одним запросом"""
+        mapping = self._resolve_target_tags(target_tags)
+        if not mapping:
+            return {}
+
+        placeholders = ', '.join('?' * len(mapping))
+        with self.data_loader.get_cursor() as cursor:
+            cursor.execute(f"""
+            SELECT ct.tag, COUNT(*)
+            FROM call_tags ct
+            JOIN calls c ON ct.call_id = c.id
+            WHERE c.call_date BETWEEN ? AND ?
+            AND ct.tag IN ({placeholders})
+            GROUP BY ct.tag
+            """, (start_iso, end_iso, *mapping))
+            rows = cursor.fetchall()
+
+        counts = defaultdict(int)
+        for tag, count in rows:
+            counts[mapping[tag]] += count
+
+        return dict(counts)
+
+    def _period_bounds(self, period: Dict) -> Tuple[int, int]:
+        """Границы [lo, hi) звонков за период в отсортированном по дате кэше"""
+        columns = self.data_loader.columns
+        if columns is not None:
+            return columns.period_bounds(period['start'], period['end'])
+
+        date_keys = self.data_loader.date_keys
+        return bisect_left(date_keys, period['start']), bisect_right(date_keys, period['end'])
+
+    @staticmethod
+    def _tag_matcher(target_tags: List[str]):
+        """Функция тег в нижнем регистре -> первый совпавший целевой тег (или None).
+
+        Совпадение - вхождение подстроки в любую сторону без учета регистра.
+        Целевые теги приводятся к нижнему регистру один раз, а результат
+        запоминается для каждого тега: уникальных тегов в данных немного,
+        поэтому перебор целевых тегов выполняется один раз на тег, а не на
+        каждое вхождение тега в звонок.
+        """
+        targets_lc = [(target, target.lower()) for target in target_tags if target]
+        cache = {}
+
+        def match(tag_lc: str) -> Optional[str]:
+            if tag_lc in cache:
+                return cache[tag_lc]
+
+            hit = None
+            for target, target_lc in targets_lc:
+                if target_lc in tag_lc or tag_lc in target_lc:
+                    hit = target
+                    break
+
+            cache[tag_lc] = hit
+            return hit
+
+        return match
 
     def _count_by_tag(self, calls: List[Dict], target_tags: List[str]) -> Dict[str, int]:
         """Подсчет звонков по тегам"""
         counts = defaultdict(int)
+        match = self._tag_matcher(target_tags)
 
         for call in calls:
-            for tag in call['tags']:
+            for tag_lc in call['tags_lc']:
                 # Проверяем, совпадает ли тег с целевыми
-                for target in target_tags:
-                    if target.lower() in tag.lower() or tag.lower() in target.lower():
-                        counts[target] += 1
-                        break
+                target = match(tag_lc)
+                if target is not None:
+                    counts[target] += 1
+
+        return dict(counts)
+
+    def _count_by_tag_columns(self, columns: JSONCallColumns, lo: int, hi: int,
+                              target_tags: List[str]) -> Dict[str, int]:
+        """Подсчет звонков по тегам через битовые маски или bincount по номерам тегов"""
+        match = self._tag_matcher(target_tags)
+
+        if columns.tag_masks is not None:
+            # Маска целевого тега - OR битов всех совпавших с ним тегов словаря
+            target_masks = defaultdict(int)
+            for tag_id, tag_lc in enumerate(columns.tag_vocab_lc):
+                target = match(tag_lc)
+                if target is not None:
+                    target_masks[target] |= 1 << tag_id
+
+            counts = columns.mask_counts(lo, hi, target_masks)
+            return {target: count for target, count in counts.items() if count}
+
+        vocab_counts = columns.tag_counts(lo, hi)
+
+        counts = defaultdict(int)
+        for tag_id, tag_lc in enumerate(columns.tag_vocab_lc):
+            target = match(tag_lc)
+            if target is not None and vocab_counts[tag_id]:
+                counts[target] += int(vocab_counts[tag_id])
 
         return dict(counts)
 
@@ -494,42 +1087,74 @@ class JSONQueryExecutor:
         if not target_tags:
             return {}
 
-        # Группируем по месяцам/неделям
-        trends = defaultdict(lambda: defaultdict(int))
+        # Группируем по месяцам/неделям: один плоский счетчик (тег, период)
+        trends = Counter()
+        match = self._tag_matcher(target_tags)
 
         for call in calls:
-            # Определяем ключ группировки
+            # Ключ группировки - кортеж чисел, строкой становится только в результате
             if grouping == 'month':
-                period_key = call['call_date'].strftime('%Y-%m')
+                period_key = (call['year'], call['month'])
             elif grouping == 'week':
-                year, week, _ = call['call_date'].isocalendar()
-                period_key = f"{year}-W{week:02d}"
+                period_key = call['iso_week']
             else:  # day
-                period_key = call['call_date'].strftime('%Y-%m-%d')
+                period_key = (call['year'], call['month'], call['day'])
 
             # Считаем теги
-            for tag in call['tags']:
-                for target in target_tags:
-                    if target.lower() in tag.lower() or tag.lower() in target.lower():
-                        trends[target][period_key] += 1
-                        break
+            for tag_lc in call['tags_lc']:
+                target = match(tag_lc)
+                if target is not None:
+                    trends[(target, period_key)] += 1
 
         # Преобразуем в список для каждого тега
+        result = defaultdict(list)
+        for (tag, period), count in sorted(trends.items()):
+            result[tag].append({'period': self._period_label(grouping, period), 'count': count})
+
+        return dict(result)
+
+    @staticmethod
+    def _period_label(grouping: str, period: Tuple[int, ...]) -> str:
+        """Строковый ключ периода: YYYY-MM, YYYY-Www или YYYY-MM-DD"""
+        if grouping == 'month':
+            return f"{period[0]}-{period[1]:02d}"
+        if grouping == 'week':
+            return f"{period[0]}-W{period[1]:02d}"
+        return f"{period[0]}-{period[1]:02d}-{period[2]:02d}"
+
+    def _tag_trends_columns(self, columns: JSONCallColumns, lo: int, hi: int,
+                            target_tags: List[str], grouping: str) -> Dict[str, List]:
+        """Динамика тегов через JIT-ядро trend_counts по номерам тегов"""
+        if not target_tags or lo >= hi:
+            return {}
+
+        # Номер тега словаря -> номер целевого тега
+        targets = [target for target in target_tags if target]
+        target_index = {target: i for i, target in enumerate(targets)}
+        match = self._tag_matcher(targets)
+        target_pos = np.array(
+            [target_index.get(match(tag_lc), -1) for tag_lc in columns.tag_vocab_lc],
+            dtype=np.int32
+        )
+
+        labels, period_ids = columns.period_ids(lo, hi, grouping)
+        counts = trend_counts(columns.tag_ptr[lo:hi + 1], columns.tag_idx, target_pos,
+                              period_ids, len(targets), len(labels))
+
         result = {}
-        for tag, period_counts in trends.items():
-            result[tag] = [
-                {'period': period, 'count': count}
-                for period, count in sorted(period_counts.items())
-            ]
+        for t, target in enumerate(targets):
+            row = counts[t]
+            if row.any():
+                result[target] = [
+                    {'period': labels[p], 'count': int(row[p])}
+                    for p in np.flatnonzero(row)
+                ]
 
         return result
 
     def _top_n_tags(self, calls: List[Dict], n: int = 5) -> List[Dict]:
         """Топ-N самых частых тегов"""
-        tag_counter = Counter()
-
-        for call in calls:
-            tag_counter.update(call['tags'])
+        tag_counter = Counter(chain.from_iterable(call['tags'] for call in calls))
 
         return [
             {'tag': tag, 'count': count}
@@ -543,10 +1168,15 @@ class JSONQueryExecutor:
 
         counts = self._count_by_tag(calls, tags[:2])
 
+        return self._comparison_result(tags, counts, len(calls))
+
+    @staticmethod
+    def _comparison_result(tags: List[str], counts: Dict[str, int], total_calls: int) -> Dict[str, Any]:
+        """Формирует результат сравнения двух тегов"""
         return {
             'tag1': {'name': tags[0], 'count': counts.get(tags[0], 0)},
             'tag2': {'name': tags[1], 'count': counts.get(tags[1], 0)},
-            'total_calls': len(calls),
+            'total_calls': total_calls,
             'ratio': counts.get(tags[0], 0) / counts.get(tags[1], 1) if counts.get(tags[1], 0) > 0 else 0
         }
 
@@ -581,9 +1211,9 @@ class DeepSeekAnalyzer:
     def _build_analyzer_prompt(self, user_query: str, results: Dict, plan: AnalysisPlan) -> str:
         """Строит промпт для анализатора"""
 
-        # Форматируем результаты для промпта
-        results_str = json.dumps(results, ensure_ascii=False, indent=2, default=str)
-        print(f'Generating answer using plan results: {results} for plan: {plan}')
+        # Форматируем результаты для промпта: компактный JSON без отступов,
+        # модели они не нужны, а строка и число токенов меньше
+        results_str = _json_dumps(results)
         print(f'User query: {user_query}')
 
         return f"""Ты — старший аналитик компании по аренде ковров.
@@ -652,15 +1282,18 @@ class DeepSeekAnalyzer:
 class JSONCallAnalyticsMCP:
     """Главная MCP система для работы с JSON файлами"""
 
-    def __init__(self, json_directory: str, model_name: str):
-        self.data_loader = JSONDataLoader(json_directory)
-        self.planner = DeepSeekPlanner(model_name)
+    def __init__(self, json_directory: str, model_name: str, planner_model: str = None,
+                 backend: str = 'list'):
+        # Планировщику хватает маленькой квантованной модели,
+        # большая модель используется только для формулировки ответа
+        self.data_loader = JSONDataLoader(json_directory, backend)
+        self.planner = get_planner(planner_model or model_name, DeepSeekPlanner)
         self.executor = JSONQueryExecutor(self.data_loader)
         self.analyzer = DeepSeekAnalyzer(model_name)
 
         # Загружаем данные при инициализации
         print("📂 Загружаю данные из JSON файлов...")
-        self.total_calls = len(self.data_loader.load_all_calls())
+        self.total_calls = self.data_loader.count_calls()
         print(f"✅ Загружено {self.total_calls} звонков")
 
     def process_query(self, user_query: str) -> Dict[str, Any]:
@@ -754,7 +1387,7 @@ class JSONCallAnalyticsMCP:
                 'start': min(dates).isoformat() if dates else None,
                 'end': max(dates).isoformat() if dates else None
             },
-            'average_text_length': sum(len(c['full_text']) for c in calls) // len(calls) if calls else 0,
+            'average_text_length': sum(c['text_length'] for c in calls) // len(calls) if calls else 0,
             'model': self.planner.model_name,
             'data_source': 'JSON files'
         }
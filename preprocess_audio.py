@@ -1,8 +1,13 @@
 from pydub import AudioSegment
-import librosa
+import numpy as np
 import noisereduce as nr
 import soundfile as sf
+import soxr
 import os
+from multiprocessing import Pool
+
+TARGET_SR = 16000
+
 
 def preprocess_audio(input_path, output_path):
     # Загрузка
@@ -14,20 +19,26 @@ def preprocess_audio(input_path, output_path):
     # Обрезаем тихие участки
     audio = audio.strip_silence(silence_len=500, silence_thresh=-40)
 
-    # Экспортируем для обработки
-    audio.export("temp.wav", format="wav")
+    # Сэмплы берем прямо из AudioSegment, без временного WAV на диске
+    audio = audio.set_channels(1)
+    y = np.array(audio.get_array_of_samples(), dtype=np.float32) / (1 << (8 * audio.sample_width - 1))
+    if audio.frame_rate != TARGET_SR:
+        y = soxr.resample(y, audio.frame_rate, TARGET_SR)
 
     # Шумоподавление
-    y, sr = librosa.load("temp.wav", sr=16000)
-    y_denoised = nr.reduce_noise(y=y, sr=sr)
+    y_denoised = nr.reduce_noise(y=y, sr=TARGET_SR)
 
     # Сохраняем результат
-    sf.write(output_path, y_denoised, sr)
+    sf.write(output_path, y_denoised, TARGET_SR)
 
     return output_path
 
 if __name__=='__main__':
-    for filename in os.listdir('audio_pool'):
-        src = os.path.join('audio_pool', filename)
-        dst = src[:-4] + '_preprocessed.wav'
-        converted_file = preprocess_audio(src, dst)
\ No newline at end of file
+    # Файлы независимы: обрабатываем их в отдельных процессах
+    tasks = [
+        (os.path.join('audio_pool', filename), os.path.join('audio_pool', filename[:-4] + '_preprocessed.wav'))
+        for filename in os.listdir('audio_pool')
+        if filename.endswith('.wav') and not filename.endswith('_preprocessed.wav')
+    ]
+    with Pool(os.cpu_count()) as pool:
+        converted_files = pool.starmap(preprocess_audio, tasks)
\ No newline at end of file
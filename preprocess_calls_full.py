@@ -1,27 +1,122 @@
 import os
+import csv
 import json
+import re
 import librosa
 import numpy as np
 import pandas as pd
-import whisper
 import soundfile as sf
-from datetime import datetime
+import soxr
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
 from pydub import AudioSegment
 import warnings
 import ffmpeg
 
+try:
+    import mutagen
+except ImportError:  # Без mutagen частота mp3/m4a узнается только после декодирования
+    mutagen = None
+
+try:
+    from analytics_kernels import frame_stats
+except ImportError:  # Без numba кадры считаются через NumPy
+    frame_stats = None
+
+try:
+    import ctranslate2
+    from faster_whisper import WhisperModel, BatchedInferencePipeline
+except ImportError:  # Без faster-whisper используем эталонный openai-whisper
+    WhisperModel = None
+    import whisper
+
 warnings.filterwarnings('ignore')
 
+TARGET_SR = 16000
+TRANSCRIBE_BATCH_SIZE = 16  # Сегментов по 30 с в одном проходе энкодера
+CSV_FIELDS = [
+    'date', 'text', 'text_length', 'source_audio', 'quality_score', 'tags', 'summary',
+    'processing_date', 'batch_number', 'whisper_model', 'audio_duration'
+]
+PREPARE_WORKERS = os.cpu_count()  # Потоков подготовки файлов, пока идет транскрибация
+PREPARE_AHEAD = 2 * PREPARE_WORKERS  # Файлов, подготовленных заранее (их сигналы в памяти)
+_DATE_RE = re.compile(r'(\d{4})-(\d{2})-(\d{2})')
+
+
+def load_audio(audio_path, sr=None):
+    """
+    Загружает аудио в моно float32 и при необходимости ресемплирует через soxr
+    sr: целевая частота, None - оставить исходную
+    """
+    try:
+        y, file_sr = sf.read(audio_path, dtype='float32', always_2d=False)
+    except RuntimeError:
+        # Форматы, которые libsndfile не читает (m4a, aac), декодируем через librosa
+        y, file_sr = librosa.load(audio_path, sr=None, mono=True)
+
+    if y.ndim == 2:
+        y = y.mean(axis=1)
+
+    if sr is not None and file_sr != sr:
+        y = soxr.resample(y, file_sr, sr, quality='HQ')
+        file_sr = sr
+
+    return y, file_sr
+
+
+def compact_csv(output_csv):
+    """
+    Убирает повторы файлов и сортирует таблицу результатов по дате
+    """
+    # Имена файлов как категории: поиск повторов хэширует коды, а не строки
+    final_df = pd.read_csv(output_csv, dtype={'source_audio': 'category'})
+    duplicated = final_df['source_audio'].duplicated(keep='first')
+
+    # Файл уже чистый и отсортирован - не переписываем его целиком
+    if not duplicated.any() and final_df['date'].is_monotonic_increasing:
+        return final_df
+
+    final_df = final_df.loc[~duplicated].sort_values('date', kind='stable')
+    final_df.to_csv(output_csv, index=False, encoding='utf-8-sig')
+    return final_df
+
+
+def probe_sample_rate(audio_path):
+    """
+    Частота дискретизации из метаданных mp3/m4a через mutagen, без декодирования
+    None, если mutagen не установлен или формат не распознан
+    """
+    if mutagen is None:
+        return None
+    media = mutagen.File(audio_path)
+    if media is None:
+        return None
+    return getattr(media.info, 'sample_rate', None)
+
 
 class AudioProcessor:
     _loaded_models = {}
     
     def __init__(self, model_size):
+        """
+        model_size: размер модели ("large", ...) или путь к модели,
+        заранее сконвертированной в CTranslate2:
+        ct2-transformers-converter --model openai/whisper-large --output_dir whisper-large-ct2 --quantization int8_float16
+        """
         self.model_size = model_size
         
         if model_size not in self._loaded_models:
             print(f"Загрузка модели Whisper {model_size}...")
-            self._loaded_models[model_size] = whisper.load_model(model_size)
+            if WhisperModel is not None:
+                # int8-веса: вдвое меньше памяти и быстрее FP16/FP32
+                if ctranslate2.get_cuda_device_count() > 0:
+                    model = WhisperModel(model_size, device='cuda', compute_type='int8_float16')
+                else:
+                    model = WhisperModel(model_size, device='cpu', compute_type='int8')
+                self._loaded_models[model_size] = BatchedInferencePipeline(model=model)
+            else:
+                self._loaded_models[model_size] = whisper.load_model(model_size)
             print(f" Модель {model_size} загружена!")
         else:
             print(f" Используем уже загруженную модель {model_size}")
@@ -29,42 +124,44 @@ class AudioProcessor:
         self.asr_model = self._loaded_models[model_size]
 
     def extract_date_from_filename(self, filename):
-        try:
-            # Пытаемся найти дату в формате YYYY-MM-DD
-            for part in filename.split('_'):
-                if len(part) == 10 and part[4] == '-' and part[7] == '-':
-                    try:
-                        return datetime.strptime(part, '%Y-%m-%d').strftime('%Y-%m-%d')
-                    except:
-                        continue
-            # Если дата не найдена, используем дату изменения файла
-            return datetime.now().strftime('%Y-%m-%d')
-        except:
-            return datetime.now().strftime('%Y-%m-%d')
+        # Ищем дату в формате YYYY-MM-DD одним проходом регулярки
+        for m in _DATE_RE.finditer(filename):
+            try:
+                # Отсекаем невозможные даты вроде 2023-13-40
+                date(int(m.group(1)), int(m.group(2)), int(m.group(3)))
+            except ValueError:
+                continue
+            return m.group(0)
+        # Если дата не найдена, используем текущую дату
+        return datetime.now().strftime('%Y-%m-%d')
         
         
     def convert_to_16k(self, audio_path, output_path=None):
-
+        """
+        Конвертация в 16 кГц
+        Возвращает путь к файлу 16 кГц и его моно-сигнал float32, чтобы
+        оценка качества не читала и не декодировала файл повторно
+        """
         if output_path is None:
             base_name = os.path.splitext(audio_path)[0]
             output_path = f"{base_name}_16k.wav"
 
         # Загружаем аудио
-        y, sr = librosa.load(audio_path, sr=None)
+        y, sr = load_audio(audio_path)
 
-        if sr == 16000:
+        if sr == TARGET_SR:
             print(f" Файл уже имеет частоту 16 кГц: {audio_path}")
-            return audio_path
+            return audio_path, y
         else:
             print(f" Конвертируем из {sr} Hz в 16000 Hz...")
 
-            # Ресемплируем до 16 кГц
-            y_16k = librosa.resample(y, orig_sr=sr, target_sr=16000)
+            # Ресемплируем до 16 кГц (soxr заметно быстрее resampy по умолчанию в librosa)
+            y_16k = soxr.resample(y, sr, TARGET_SR, quality='HQ')
 
             # Сохраняем как WAV файл
-            sf.write(output_path, y_16k, 16000, subtype='PCM_16')
+            sf.write(output_path, y_16k, TARGET_SR, subtype='PCM_16')
 
-            return output_path
+            return output_path, y_16k
 
     def convert_to_16k_ffprobe(self, audio_path, output_path=None):
         """
@@ -74,42 +171,67 @@ class AudioProcessor:
             base_name = os.path.splitext(audio_path)[0]
             output_path = f"{base_name}_16k.wav"
 
-        # Проверяем текущую частоту
-        y, sr = librosa.load(audio_path, sr=None)
-
-        if sr == 16000:
+        # Проверяем текущую частоту по заголовку, без декодирования
+        try:
+            sr = sf.info(audio_path).samplerate
+            sf_readable = True
+        except RuntimeError:
+            # libsndfile не знает формат (m4a, aac): частота из метаданных
+            sr = probe_sample_rate(audio_path)
+            sf_readable = False
+
+        if sr == TARGET_SR:
             print(f" Файл уже имеет частоту 16 кГц: {audio_path}")
             return audio_path
-        else:
-            print(f" Конвертируем из {sr} Hz в 16000 Hz...")
 
-            # Конвертируем
+        if not sf_readable:
+            # Конвертируем через ffmpeg только то, что soundfile не читает
+            print(" Конвертируем в 16000 Hz через ffmpeg...")
             audio = AudioSegment.from_file(audio_path)
-            audio = audio.set_frame_rate(16000).set_channels(1)
+            audio = audio.set_frame_rate(TARGET_SR).set_channels(1)
             audio.export(output_path, format="wav")
-
             return output_path
 
-    def assess_quality(self, audio_path):
-        try:
-            y, sr = librosa.load(audio_path, sr=16000)
+        print(f" Конвертируем из {sr} Hz в 16000 Hz...")
 
-            # 1. Проверка громкости
-            rms = librosa.feature.rms(y=y)
-            rms_mean = np.mean(rms)
+        # Декодируем и ресемплируем в процессе, без ffmpeg
+        y, _ = load_audio(audio_path, sr=TARGET_SR)
+        sf.write(output_path, y, TARGET_SR, subtype='PCM_16')
 
-            # 2. Проверка на шум (через zero-crossing rate)
-            zcr = librosa.feature.zero_crossing_rate(y)
-            zcr_mean = np.mean(zcr)
+        return output_path
+
+    def assess_quality(self, y, sr=TARGET_SR):
+        """
+        Оценка качества по уже декодированному моно-сигналу
+        """
+        try:
+            if sr != TARGET_SR:
+                y = soxr.resample(y, sr, TARGET_SR, quality='HQ')
 
-            # 3. Проверка на тишину (паузы)
             frame_length = 2048
             hop_length = 512
-            rms_frames = librosa.feature.rms(y=y, frame_length=frame_length, hop_length=hop_length)[0]
-            silence_threshold = np.mean(rms_frames) * 0.1
+            if len(y) < frame_length:
+                y = np.pad(y, (0, frame_length - len(y)))
+
+            # Кадровая RMS и zero-crossing rate (признак шума) считаются один раз
+            if frame_stats is not None:
+                # Одним JIT-проходом по сигналу, кадры - параллельно
+                rms_frames, zcr_mean = frame_stats(np.ascontiguousarray(y, dtype=np.float32),
+                                                   frame_length, hop_length)
+            else:
+                # Окна - представления над y, без копий
+                frames = np.lib.stride_tricks.sliding_window_view(y, frame_length)[::hop_length]
+                rms_frames = np.sqrt(np.mean(np.square(frames, dtype=np.float32), axis=1))
+                zcr_mean = np.count_nonzero(np.diff(np.signbit(y))) / (len(y) - 1)
+
+            # 1. Проверка громкости
+            rms_mean = np.mean(rms_frames)
+
+            # 2. Проверка на тишину (паузы)
+            silence_threshold = rms_mean * 0.1
             silent_ratio = np.sum(rms_frames < silence_threshold) / len(rms_frames)
 
-            # 4. Расчет оценки
+            # 3. Расчет оценки
             score = 5  # Базовая оценка
 
             # Корректировка на основе громкости
@@ -141,22 +263,35 @@ class AudioProcessor:
             print(f"Ошибка при оценке качества: {e}")
             return 5  # Средняя оценка при ошибке
 
-    def transcribe_audio(self, audio_path):
+    def transcribe_audio(self, audio):
         """
         Транскрибация аудио в текст
+        audio: путь к файлу или моно-сигнал float32 16 кГц (без повторного декодирования)
         """
         try:
-            result = self.asr_model.transcribe(audio_path)
+            if WhisperModel is not None:
+                # VAD режет запись на независимые фрагменты речи, они
+                # декодируются пачками без токенов временных меток
+                segments, _ = self.asr_model.transcribe(
+                    audio,
+                    batch_size=TRANSCRIBE_BATCH_SIZE,
+                    vad_filter=True,
+                    without_timestamps=True,
+                )
+                # Генератор читается до конца
+                return ' '.join(segment.text.strip() for segment in segments).strip()
+
+            # Временные метки для текста не нужны - не декодируем их
+            result = self.asr_model.transcribe(audio, without_timestamps=True)
             return result['text'].strip()
         except Exception as e:
             print(f"Ошибка при транскрибации: {e}")
             return ""
 
-    def process_file(self, audio_path, quality_threshold, transcribe_all):
+    def prepare_file(self, audio_path):
         """
-        Полная обработка одного аудиофайла
-        transcribe_all: если True - транскрибировать все файлы,
-                       если False - транскрибировать только качественные
+        Подготовка файла к транскрибации: дата, конвертация в 16 кГц, оценка качества
+        Возвращает (дата, путь 16 кГц, сигнал 16 кГц, оценка качества)
         """
         print(f"\n{'=' * 60}")
         print(f"Обработка файла: {audio_path}")
@@ -166,13 +301,26 @@ class AudioProcessor:
         date = self.extract_date_from_filename(os.path.basename(audio_path))
 
         # Конвертируем в 16 кГц
-        converted_path = self.convert_to_16k(audio_path)
+        converted_path, y = self.convert_to_16k(audio_path)
         print('Converted')
 
         print('Quality estimation...')
-        quality_score = self.assess_quality(converted_path)
+        quality_score = self.assess_quality(y)
         print(f"Estimated quality: {quality_score}/10")
 
+        return date, converted_path, y, quality_score
+
+    def process_file(self, audio_path, quality_threshold, transcribe_all, prepared=None):
+        """
+        Полная обработка одного аудиофайла
+        transcribe_all: если True - транскрибировать все файлы,
+                       если False - транскрибировать только качественные
+        prepared: результат prepare_file, если файл уже подготовлен
+        """
+        if prepared is None:
+            prepared = self.prepare_file(audio_path)
+        date, converted_path, y, quality_score = prepared
+
         # Определяем, нужно ли транскрибировать
         text = '-'
         should_transcribe = transcribe_all or quality_score >= quality_threshold
@@ -180,7 +328,8 @@ class AudioProcessor:
         if should_transcribe:
             # Транскрибируем
             print("Транскрибация...")
-            text = self.transcribe_audio(converted_path)
+            # Сигнал уже в памяти - whisper не запускает ffmpeg заново
+            text = self.transcribe_audio(y)
             if text == '':
                 text = '-'
         else:
@@ -210,7 +359,8 @@ class AudioProcessor:
         if os.path.exists(output_csv):
             print(f"Found existing file: {output_csv}")
             try:
-                existing_df = pd.read_csv(output_csv)
+                # Для проверки нужен только один столбец, тексты не читаем
+                existing_df = pd.read_csv(output_csv, usecols=['source_audio'])
                 existing_files = set(existing_df['source_audio'].tolist())
                 print(f"File already contains {len(existing_files)} records")
             except Exception as e:
@@ -239,62 +389,72 @@ class AudioProcessor:
         total_processed = 0
         all_results = []
 
-        for batch_num, batch_files in enumerate(batches, 1):
-            print(f"\n{'=' * 60}")
-            print(f"Processing batch {batch_num}/{len(batches)}")
-            print(f"{'=' * 60}")
-
-            batch_results = []
-
-            for i, audio_file in enumerate(batch_files, 1):
-                global_idx = total_processed + i
-                print(f"\nProcessing file {global_idx}/{len(audio_files)} (batch {batch_num}, file {i}/{len(batch_files)})")
-                try:
-                    result = self.process_file(audio_file, quality_threshold, transcribe_all)
-                    batch_results.append(result)
-                    print(f"Added to list: {os.path.basename(audio_file)}")
-                except Exception as e:
-                    print(f"Error processing {audio_file}: {e}")
-
-            if batch_results:
-                batch_df = pd.DataFrame(batch_results)
-
-                write_mode = 'a' if os.path.exists(output_csv) and batch_num > 1 else 'w'
-                write_header = not (os.path.exists(output_csv) and batch_num > 1)
-
-                if write_mode == 'a' and batch_num > 1:
-                    existing_df = pd.read_csv(output_csv)
-                    final_df = pd.concat([existing_df, batch_df], ignore_index=True)
-                    final_df = final_df.drop_duplicates(subset=['source_audio'], keep='first')
-                    final_df = final_df.sort_values('date')
-                    final_df.to_csv(output_csv, index=False, encoding='utf-8-sig')
-                else:
-                    if os.path.exists(output_csv) and batch_num == 1:
-                        existing_df = pd.read_csv(output_csv)
-                        final_df = pd.concat([existing_df, batch_df], ignore_index=True)
-                        final_df = final_df.drop_duplicates(subset=['source_audio'], keep='first')
-                        final_df = final_df.sort_values('date')
-                    else:
-                        final_df = batch_df.sort_values('date')
-
-                    final_df.to_csv(output_csv, index=False, encoding='utf-8-sig')
-
-                total_processed += len(batch_results)
-                all_results.extend(batch_results)
-
-                print(f"\nBatch {batch_num} results:")
-                print(f"Files processed in batch: {len(batch_results)}")
-                print(f"Total files processed: {total_processed}/{len(audio_files)}")
-                print(f"Intermediate results saved to: {output_csv}")
+        # Конвертация и оценка качества файлов идут параллельно в фоне,
+        # основной поток транскрибирует файлы по очереди. Подготовленные
+        # файлы держат сигнал в памяти, поэтому вперед готовится не больше
+        # PREPARE_AHEAD файлов
+        with ThreadPoolExecutor(max_workers=PREPARE_WORKERS) as prepare_executor:
+            pending_files = iter(audio_files)
+            prepared = deque()
+
+            def submit_next():
+                audio_file = next(pending_files, None)
+                if audio_file is not None:
+                    prepared.append((prepare_executor.submit(self.prepare_file, audio_file), audio_file))
+
+            for _ in range(PREPARE_AHEAD):
+                submit_next()
+
+            # Файл открывается один раз на дозапись, каждая строка сбрасывается
+            # на диск сразу: прерванный запуск теряет не больше одного файла
+            write_header = not os.path.exists(output_csv) or os.path.getsize(output_csv) == 0
+            with open(output_csv, 'a', newline='', encoding='utf-8-sig') as csv_file:
+                writer = csv.DictWriter(csv_file, fieldnames=CSV_FIELDS)
+                if write_header:
+                    writer.writeheader()
+
+                for batch_num, batch_files in enumerate(batches, 1):
+                    print(f"\n{'=' * 60}")
+                    print(f"Processing batch {batch_num}/{len(batches)}")
+                    print(f"{'=' * 60}")
+
+                    batch_results = []
+
+                    for i in range(1, len(batch_files) + 1):
+                        future, audio_file = prepared.popleft()
+                        submit_next()
+                        global_idx = total_processed + i
+                        print(f"\nProcessing file {global_idx}/{len(audio_files)} (batch {batch_num}, file {i}/{len(batch_files)})")
+                        try:
+                            result = self.process_file(audio_file, quality_threshold, transcribe_all,
+                                                       prepared=future.result())
+                            writer.writerow(result)
+                            csv_file.flush()
+                            os.fsync(csv_file.fileno())
+                            batch_results.append(result)
+                            print(f"Added to list: {os.path.basename(audio_file)}")
+                        except Exception as e:
+                            print(f"Error processing {audio_file}: {e}")
+
+                    if batch_results:
+                        total_processed += len(batch_results)
+                        all_results.extend(batch_results)
+
+                        print(f"\nBatch {batch_num} results:")
+                        print(f"Files processed in batch: {len(batch_results)}")
+                        print(f"Total files processed: {total_processed}/{len(audio_files)}")
+                        print(f"Intermediate results saved to: {output_csv}")
+
+        # Дубликаты и сортировка - один проход по файлу в конце запуска
+        final_df = compact_csv(output_csv)
 
         print(f"\n{'=' * 60}")
         print(f"All batches processing completed!")
-        print(f"Total records in file: {len(pd.read_csv(output_csv))}")
+        print(f"Total records in file: {len(final_df)}")
         print(f"New records added: {total_processed}")
         print(f"Results saved to: {output_csv}")
         print(f"{'=' * 60}")
 
-        final_df = pd.read_csv(output_csv)
         print("\nStatistics:")
         print(f"Average quality score: {final_df['quality_score'].mean():.1f}")
         print(f"Total text characters: {final_df['text'].str.len().sum()}")
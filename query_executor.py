@@ -1,18 +1,149 @@
+import csv
+import json
 import sqlite3
+import threading
 from datetime import datetime, timedelta
+from itertools import islice
+from typing import Any, Iterable, Tuple
 from llm_query_planner import AnalysisPlan, MetricType, List, Dict
 
+
+class Database:
+    """Соединение SQLite на поток с настроенными PRAGMA"""
+
+    PRAGMAS = """
+    PRAGMA journal_mode=WAL;
+    PRAGMA synchronous=NORMAL;
+    PRAGMA temp_store=MEMORY;
+    PRAGMA mmap_size=268435456;
+    PRAGMA cache_size=-65536;
+    """
+
+    def __init__(self, db_path: str, cached_statements: int = 256):
+        # Для ':memory:' у каждого потока будет своя база
+        self.db_path = db_path
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """Соединение текущего потока (PRAGMA выполняются при первом обращении)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # sqlite3 кэширует подготовленные выражения по тексту запроса
+            conn = sqlite3.connect(self.db_path, cached_statements=self.cached_statements)
+            conn.executescript(self.PRAGMAS)
+            # Доступ к столбцам по имени без сборки словарей в Python
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def execute(self, query: str, params: tuple = ()) -> sqlite3.Cursor:
+        """Выполняет запрос с привязкой параметров"""
+        return self.conn.execute(query, params)
+
+    def close(self):
+        """Закрывает соединение текущего потока"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            # Обновляем статистику планировщика по таблицам, которые менялись
+            conn.execute("PRAGMA optimize")
+            conn.close()
+            self._local.conn = None
+
+
+CSV_INSERT_CHUNK = 10000  # Строк CSV на одну транзакцию вставки
+
+
+def _parse_csv_tags(value: str) -> List[str]:
+    """Теги из ячейки CSV: JSON-массив или перечисление через запятую"""
+    if not value:
+        return []
+    if value.startswith('['):
+        return json.loads(value)
+    return [tag.strip() for tag in value.split(',') if tag.strip()]
+
+
+# Индексы и триггеры схемы. Выполняются по одному через execute, а не
+# executescript: executescript фиксирует текущую транзакцию
+_SCHEMA_STATEMENTS = (
+    "CREATE INDEX IF NOT EXISTS idx_calls_date ON calls(call_date)",
+    "CREATE INDEX IF NOT EXISTS idx_calls_customer ON calls(customer_id)",
+    "CREATE INDEX IF NOT EXISTS idx_call_tags ON call_tags(tag, call_id)",
+    # Обратный покрывающий индекс: топ-N за короткий период идет от
+    # idx_calls_date к тегам звонка, триггеры удаляют теги по call_id
+    "CREATE INDEX IF NOT EXISTS idx_call_tags_call ON call_tags(call_id, tag)",
+    """
+    -- call_tags поддерживается триггерами из calls.tags_json
+    CREATE TRIGGER IF NOT EXISTS trg_calls_tags_insert AFTER INSERT ON calls
+    BEGIN
+        INSERT INTO call_tags (call_id, tag)
+        SELECT NEW.id, value FROM json_each(NEW.tags_json);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_calls_tags_update AFTER UPDATE OF tags_json ON calls
+    BEGIN
+        DELETE FROM call_tags WHERE call_id = OLD.id;
+        INSERT INTO call_tags (call_id, tag)
+        SELECT NEW.id, value FROM json_each(NEW.tags_json);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_calls_tags_delete AFTER DELETE ON calls
+    BEGIN
+        DELETE FROM call_tags WHERE call_id = OLD.id;
+    END
+    """,
+    """
+    -- calls_tags_fts - external content таблица над calls,
+    -- ее индекс тоже поддерживается триггерами
+    CREATE TRIGGER IF NOT EXISTS trg_calls_fts_insert AFTER INSERT ON calls
+    BEGIN
+        INSERT INTO calls_tags_fts (rowid, tags_json) VALUES (NEW.id, NEW.tags_json);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_calls_fts_update AFTER UPDATE OF tags_json ON calls
+    BEGIN
+        INSERT INTO calls_tags_fts (calls_tags_fts, rowid, tags_json) VALUES ('delete', OLD.id, OLD.tags_json);
+        INSERT INTO calls_tags_fts (rowid, tags_json) VALUES (NEW.id, NEW.tags_json);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_calls_fts_delete AFTER DELETE ON calls
+    BEGIN
+        INSERT INTO calls_tags_fts (calls_tags_fts, rowid, tags_json) VALUES ('delete', OLD.id, OLD.tags_json);
+    END
+    """,
+)
+
+
 class DatabaseExecutor:
     """Выполняет запросы к базе данных по плану от LLM"""
 
     def __init__(self, db_path: str = "calls_database.db"):
-        self.conn = sqlite3.connect(db_path)
+        self.db = Database(db_path)
+        # Тексты запросов динамики по режиму группировки: одинаковый текст
+        # попадает в кэш подготовленных выражений sqlite3
+        self._stmt_cache = {}
         self._init_database()
 
+    @property
+    def conn(self) -> sqlite3.Connection:
+        return self.db.conn
+
     def _init_database(self):
         """Инициализация таблиц (если не существует)"""
-        cursor = self.conn.cursor()
-
+        # Вся схема создается одной транзакцией: при ошибке откатывается целиком
+        with self.conn:
+            cursor = self.conn.cursor()
+            cursor.execute("BEGIN")
+            self._create_schema(cursor)
+            self._migrate_schema(cursor)
+
+    def _create_schema(self, cursor):
+        """Таблица звонков, индекс по дате и FTS-таблица тегов"""
         # Таблица звонков
         cursor.execute("""
         CREATE TABLE IF NOT EXISTS calls (
@@ -36,127 +167,212 @@ class DatabaseExecutor:
         USING fts5(tags_json, content='calls', content_rowid='id')
         """)
 
-        self.conn.commit()
+    def _migrate_schema(self, cursor):
+        """Нормализованная таблица тегов и индексы под аналитические запросы"""
+
+        # Развернутая таблица тегов: один тег - одна строка,
+        # чтобы фильтровать по тегу без LIKE-сканирования tags_json
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS call_tags (
+            call_id INTEGER NOT NULL,
+            tag TEXT NOT NULL,
+            FOREIGN KEY (call_id) REFERENCES calls(id) ON DELETE CASCADE
+        )
+        """)
+
+        for statement in _SCHEMA_STATEMENTS:
+            cursor.execute(statement)
+
+        # Заполняем call_tags для звонков, добавленных до появления триггеров
+        cursor.execute("""
+        INSERT INTO call_tags (call_id, tag)
+        SELECT calls.id, tag.value
+        FROM calls, json_each(calls.tags_json) AS tag
+        WHERE NOT EXISTS (SELECT 1 FROM call_tags WHERE call_tags.call_id = calls.id)
+        """)
+
+        # Полнотекстовый индекс строился без триггеров - пересобираем его
+        cursor.execute("""
+        SELECT (SELECT COUNT(*) FROM calls_tags_fts_docsize) < (SELECT COUNT(*) FROM calls)
+        """)
+        if cursor.fetchone()[0]:
+            cursor.execute("INSERT INTO calls_tags_fts (calls_tags_fts) VALUES ('rebuild')")
+
+    def insert_calls(self, rows: Iterable[Dict[str, Any]]) -> int:
+        """Добавляет звонки одной транзакцией (один fsync на пачку)
+
+        Строка: call_date, full_text, summary, tags (список) и необязательные
+        duration_sec, customer_id. call_tags и FTS заполняют триггеры.
+        """
+        params = [
+            (row['call_date'], row['full_text'], row.get('summary', ''),
+             json.dumps(row.get('tags', []), ensure_ascii=False),
+             row.get('duration_sec'), row.get('customer_id'))
+            for row in rows
+        ]
+        with self.conn:
+            self.conn.executemany("""
+            INSERT INTO calls (call_date, full_text, summary, tags_json, duration_sec, customer_id)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """, params)
+        return len(params)
+
+    def insert_calls_from_csv(self, csv_path: str, chunk_size: int = CSV_INSERT_CHUNK) -> int:
+        """Загружает таблицу AudioProcessor.process_directory пачками по chunk_size строк"""
+        inserted = 0
+        with open(csv_path, newline='', encoding='utf-8-sig') as csv_file:
+            reader = csv.DictReader(csv_file)
+            while True:
+                chunk = [
+                    {
+                        'call_date': record['date'],
+                        'full_text': record['text'],
+                        'summary': record.get('summary') or '',
+                        'tags': _parse_csv_tags(record.get('tags')),
+                        'duration_sec': int(float(record['audio_duration'])) if record.get('audio_duration') else None,
+                    }
+                    for record in islice(reader, chunk_size)
+                ]
+                if not chunk:
+                    break
+                inserted += self.insert_calls(chunk)
+        return inserted
 
     def execute_analysis_plan(self, plan: AnalysisPlan) -> Dict[str, Any]:
         """Выполняет план анализа и возвращает данные"""
 
+        start = plan.time_period['start']
+        end = plan.time_period['end']
+
+        # Агрегация целиком выполняется в SQLite, Python только форматирует
+        metric_handlers = {
+            MetricType.COUNT_BY_TAG: lambda: self._get_counts_by_tag(
+                start, end, plan.target_tags),
+            MetricType.TAG_TRENDS: lambda: self._get_tag_trends(
+                start, end, plan.target_tags[0] if plan.target_tags else None, plan.grouping),
+            MetricType.TOP_N_TAGS: lambda: self._get_top_n_tags(start, end, n=5),
+            MetricType.COMPARISON: lambda: self._compare_tags(
+                start, end, plan.comparison_tags or plan.target_tags[:2]),
+        }
+
         results = {}
 
         # Для каждой метрики в плане
         for metric in plan.metrics:
-            if metric == MetricType.COUNT_BY_TAG:
-                results['count_by_tag'] = self._get_counts_by_tag(
-                    plan.time_period['start'],
-                    plan.time_period['end'],
-                    plan.target_tags
-                )
-
-            elif metric == MetricType.TAG_TRENDS:
-                results['tag_trends'] = self._get_tag_trends(
-                    plan.time_period['start'],
-                    plan.time_period['end'],
-                    plan.target_tags[0] if plan.target_tags else None,
-                    plan.grouping
-                )
-
-            elif metric == MetricType.TOP_N_TAGS:
-                results['top_n_tags'] = self._get_top_n_tags(
-                    plan.time_period['start'],
-                    plan.time_period['end'],
-                    n=5
-                )
-
-            elif metric == MetricType.COMPARISON:
-                results['comparison'] = self._compare_tags(
-                    plan.time_period['start'],
-                    plan.time_period['end'],
-                    plan.comparison_tags or plan.target_tags[:2]
-                )
+            handler = metric_handlers.get(metric)
+            if handler is not None:
+                results[metric.value] = handler()
 
         return results
 
-    def _get_counts_by_tag(self, start_date: datetime, end_date: datetime,
-                           tags: List[str]) -> Dict[str, int]:
-        """Количество звонков по тегам за период"""
-        cursor = self.conn.cursor()
+    def _count_by_tag_sql(self, start_date: datetime, end_date: datetime,
+                          tags: List[str]) -> List[Tuple[str, int]]:
+        """Количество звонков по тегам одним запросом: [(тег, количество)]"""
+        tags = [tag for tag in tags if tag is not None]
+        if not tags:
+            return []
 
-        # Для каждого тега делаем запрос
-        results = {}
-        for tag in tags:
-            query = """
-            SELECT COUNT(*) 
-            FROM calls 
-            WHERE call_date BETWEEN ? AND ?
-            AND tags_json LIKE ?
-            """
+        placeholders = ', '.join('?' * len(tags))
+        query = f"""
+        SELECT ct.tag, COUNT(DISTINCT ct.call_id)
+        FROM call_tags ct
+        JOIN calls c ON c.id = ct.call_id
+        WHERE c.call_date BETWEEN ? AND ?
+        AND ct.tag IN ({placeholders})
+        GROUP BY ct.tag
+        """
 
-            # Ищем тег в JSON массиве
-            tag_pattern = f'%"{tag}"%'
+        return self.conn.execute(query, (start_date, end_date, *tags)).fetchall()
 
-            cursor.execute(query, (start_date, end_date, tag_pattern))
-            count = cursor.fetchone()[0]
-            results[tag] = count
+    def _top_n_tags_sql(self, start_date: datetime, end_date: datetime,
+                        n: int) -> List[Tuple[str, int]]:
+        """Топ-N тегов за период: [(тег, количество)]"""
+        query = """
+        SELECT ct.tag, COUNT(*) AS count
+        FROM call_tags ct
+        JOIN calls c ON c.id = ct.call_id
+        WHERE c.call_date BETWEEN ? AND ?
+        GROUP BY ct.tag
+        ORDER BY count DESC
+        LIMIT ?
+        """
 
-        return results
+        return self.conn.execute(query, (start_date, end_date, n)).fetchall()
 
-    def _get_tag_trends(self, start_date: datetime, end_date: datetime,
-                        tag: str, grouping: str = "month") -> List[Dict]:
-        """Динамика тега по периодам (месяцам/неделям)"""
-        cursor = self.conn.cursor()
+    def _tag_trends_sql(self, start_date: datetime, end_date: datetime,
+                        tag: str, grouping: str) -> List[Tuple[str, int]]:
+        """Динамика тега по периодам: [(период, количество)]"""
+        if tag is None:
+            # Без тега - динамика всех звонков
+            query = self._tag_trends_query(grouping, with_tag=False)
+            params = (start_date, end_date)
+        else:
+            query = self._tag_trends_query(grouping, with_tag=True)
+            params = (tag, start_date, end_date)
+
+        return self.conn.execute(query, params).fetchall()
+
+    def _tag_trends_query(self, grouping: str, with_tag: bool) -> str:
+        """Текст запроса динамики, собранный один раз на режим группировки"""
+        key = (grouping, with_tag)
+        query = self._stmt_cache.get(key)
+        if query is not None:
+            return query
 
         if grouping == "month":
-            period_format = "strftime('%Y-%m', call_date)"
-            period_name = "month"
-        else:  # week
-            period_format = "strftime('%Y-%W', call_date)"
-            period_name = "week"
+            period_format = "strftime('%Y-%m', c.call_date)"
+        elif grouping == "week":
+            period_format = "strftime('%Y-%W', c.call_date)"
+        else:  # day
+            period_format = "date(c.call_date)"
+
+        if with_tag:
+            query = f"""
+            SELECT {period_format} AS period, COUNT(DISTINCT c.id) AS count
+            FROM call_tags ct
+            JOIN calls c ON c.id = ct.call_id
+            WHERE ct.tag = ?
+            AND c.call_date BETWEEN ? AND ?
+            GROUP BY period
+            ORDER BY period
+            """
+        else:
+            query = f"""
+            SELECT {period_format} AS period, COUNT(*) AS count
+            FROM calls c
+            WHERE c.call_date BETWEEN ? AND ?
+            GROUP BY period
+            ORDER BY period
+            """
 
-        query = f"""
-        SELECT 
-            {period_format} as period,
-            COUNT(*) as count
-        FROM calls 
-        WHERE call_date BETWEEN ? AND ?
-        AND tags_json LIKE ?
-        GROUP BY period
-        ORDER BY period
-        """
+        self._stmt_cache[key] = query
+        return query
 
-        tag_pattern = f'%"{tag}"%' if tag else '%'
-        cursor.execute(query, (start_date, end_date, tag_pattern))
+    def _get_counts_by_tag(self, start_date: datetime, end_date: datetime,
+                           tags: List[str]) -> Dict[str, int]:
+        """Количество звонков по тегам за период"""
+        counts = dict(self._count_by_tag_sql(start_date, end_date, tags))
 
-        rows = cursor.fetchall()
+        # Теги без звонков тоже попадают в результат
+        return {tag: counts.get(tag, 0) for tag in tags}
+
+    def _get_tag_trends(self, start_date: datetime, end_date: datetime,
+                        tag: str, grouping: str = "month") -> List[Dict]:
+        """Динамика тега по периодам (месяцам/неделям)"""
+        period_name = grouping if grouping in ("month", "week") else "day"
+        rows = self._tag_trends_sql(start_date, end_date, tag, grouping)
 
         return [
-            {period_name: row[0], 'count': row[1]}
+            {period_name: row['period'], 'count': row['count']}
             for row in rows
         ]
 
     def _get_top_n_tags(self, start_date: datetime, end_date: datetime,
                         n: int = 5) -> List[Dict]:
         """Топ-N самых частых тегов за период"""
-        cursor = self.conn.cursor()
-
-        # Сложный запрос для агрегации тегов из JSON
-        query = """
-        WITH tag_counts AS (
-            SELECT 
-                json_each.value as tag,
-                COUNT(*) as count
-            FROM calls, json_each(json(calls.tags_json))
-            WHERE call_date BETWEEN ? AND ?
-            GROUP BY json_each.value
-            ORDER BY count DESC
-            LIMIT ?
-        )
-        SELECT tag, count FROM tag_counts
-        """
-
-        cursor.execute(query, (start_date, end_date, n))
-        rows = cursor.fetchall()
+        rows = self._top_n_tags_sql(start_date, end_date, n)
 
-        return [{'tag': row[0], 'count': row[1]} for row in rows]
+        return [{'tag': row['tag'], 'count': row['count']} for row in rows]
 
     def _compare_tags(self, start_date: datetime, end_date: datetime,
                       tags: List[str]) -> Dict[str, Any]:
@@ -177,10 +393,32 @@ class DatabaseExecutor:
             'percentage2': counts.get(tags[1], 0) / total_calls * 100 if total_calls > 0 else 0
         }
 
+    def search_calls_by_tag_text(self, text: str, start_date: datetime,
+                                 end_date: datetime) -> List[Dict]:
+        """Звонки за период, теги которых содержат слова из text (FTS5)"""
+        # Теги пишутся через '_', токенизатор FTS5 делит их на слова:
+        # ищем фразу из тех же слов
+        phrase = ' '.join(text.replace('_', ' ').split()).replace('"', '""')
+        if not phrase:
+            return []
+
+        rows = self.db.execute("""
+        SELECT c.id, c.call_date, c.summary, c.tags_json
+        FROM calls_tags_fts
+        JOIN calls c ON c.id = calls_tags_fts.rowid
+        WHERE calls_tags_fts MATCH ?
+        AND c.call_date BETWEEN ? AND ?
+        ORDER BY c.call_date
+        """, (f'"{phrase}"', start_date, end_date)).fetchall()
+
+        return [
+            {'id': row['id'], 'call_date': row['call_date'], 'summary': row['summary'],
+             'tags': json.loads(row['tags_json'])}
+            for row in rows
+        ]
+
     def _get_total_calls_count(self, start_date: datetime, end_date: datetime) -> int:
         """Общее количество звонков за период"""
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM calls WHERE call_date BETWEEN ? AND ?",
-                       (start_date, end_date))
-        return cursor.fetchone()[0]
+        return self.db.execute("SELECT COUNT(*) FROM calls WHERE call_date BETWEEN ? AND ?",
+                               (start_date, end_date)).fetchone()[0]
 
@@ -1,9 +1,132 @@
+import calendar
+import logging
 import re
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from dateutil import parser
 from typing import Dict, List, Optional, Tuple
 import json
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
+
+
+# Ход разбора пишется на уровне DEBUG: строки сообщений собираются,
+# только если этот уровень включен
+logger = logging.getLogger(__name__)
+
+# Группа регулярки 'last_n' -> (единица, длительность N единиц)
+LAST_N_UNITS = {
+    'd': ('days', lambda n: timedelta(days=n)),
+    'w': ('weeks', lambda n: timedelta(weeks=n)),
+    'mo': ('months', lambda n: timedelta(days=30 * n)),  # Приблизительно
+    'y': ('years', lambda n: timedelta(days=365 * n)),
+    'h': ('hours', lambda n: timedelta(hours=n)),
+}
+
+
+# Специальные периоды, которые распознает _parse_standard_periods
+SPECIAL_CASE_KEYS = (
+    'today', 'yesterday', 'this_week', 'last_week',
+    'this_month', 'last_month', 'this_year', 'last_year',
+)
+
+
+# ОСНОВНЫЕ РЕГУЛЯРКИ (95% покрытие)
+_RAW_PATTERNS = {
+    # 1. Абсолютные даты (01.01.2024, 1 января 2024)
+    # Разделители '/' и '-' заменяются на '.' в _normalize
+    'date_dmy': r'(\d{1,2})\.(\d{1,2})\.(\d{4})',
+    'date_ymd': r'(\d{4})\.(\d{1,2})\.(\d{1,2})',
+    'date_words': r'(\d{1,2})\s+(январ[ья]|феврал[ья]|март[а]?|апрел[ья]|ма[йя]|июн[ья]|июл[ья]|август[а]?|сентябр[ья]|октябр[ья]|ноябр[ья]|декабр[ья])\s+(\d{4})',
+
+    # 2. Относительные периоды (последние N единиц)
+    # Одна регулярка на все единицы: единицу выдает сработавшая группа
+    'last_n': (r'последн(?:и[йехя]?|яя)\s*(?P<n>\d+)\s*(?:(?P<d>дн(?:ей|я|ю)?|день)|(?P<w>недел[ьиюя]?)'
+               r'|(?P<mo>месяц(?:ев|а|е)?)|(?P<y>год(?:ов|а|у)?|лет)|(?P<h>час(?:ов|а)?))\b'),
+
+    # 3. Специальные периоды
+    'today': r'\bсегодн[яя]\b',
+    'yesterday': r'\bвчера\b',
+    'tomorrow': r'\bзавтра\b',
+    'this_week': r'\bна\s*этой\s*недел[еи]\b',
+    'last_week': r'\bна\s*прошлой\s*недел[еи]\b',
+    'next_week': r'\bна\s*следующей\s*недел[еи]\b',
+    'this_month': r'\bв\s*этом\s*месяц[ее]\b',
+    'last_month': r'\bв\s*прошлом\s*месяц[ее]\b',
+    'next_month': r'\bв\s*следующем\s*месяц[ее]\b',
+    'this_year': r'\bв\s*этом\s*год[уу]\b',
+    'last_year': r'\bв?\s*прошлом\s*год[уу]\b',
+    'next_year': r'\bв?\s*следующем\s*год[уу]\b',
+
+    # 4. Кварталы
+    'quarter': r'(\d+)\.?[ыи]?\s*квартал\s*(\d{4})?',
+    'last_quarter': r'последни[ей]?\s*квартал',
+
+    # 5. Сложные комбинации (ваш случай!)
+    'last_n_of_year': r'последни[ех]?\s*(\d+)\s*месяц(?:ев|а|е)?\s*(прошлого|текущего|этого)\s+год[ау]?\b',
+    'first_n_of_year': r'первы[ех]?\s*(\d+)\s*месяц(?:ев|а|е)?\s*(прошлого|текущего|этого)\s+год[ау]?\b',
+
+    # 6. Периоды "с ... по ..."
+    # Начало периода и разделитель ищутся отдельно (см. _split_range):
+    # пара (.+?) ... (.+) в одной регулярке перебирает все точки разбиения
+    'from_to': r'с\s',
+    'from_to_sep': r'\sпо\s',
+    'between': r'между\s',
+    'between_sep': r'\sи\s',
+
+    # 7. Без точной даты
+    'recently': r'\bнедавно\b|\bна\s*днях\b',
+    'lately': r'\bв\s*последнее\s*время\b',
+    'in_past': r'\bв\s*прошлом\b',
+}
+
+# Компилируются один раз при импорте: search не ходит в кэш модуля re,
+# а создание парсера ничего не компилирует.
+# Запрос приводится к нижнему регистру до поиска, IGNORECASE не нужен
+_PATTERNS = {key: re.compile(pattern) for key, pattern in _RAW_PATTERNS.items()}
+
+# Слова, без которых не сработает ни один из разборов _parse_*
+# (даты для "с ... по ..." всегда содержат цифры)
+_TRIGGER_RE = re.compile(r'последн|первы|сегодн|вчера|недел|месяц|год|лет|\d')
+
+# Признак периода "с ... по ..." для _try_dateutil (запрос там в исходном регистре)
+_FROM_TO_CHECK = re.compile(r'\bпо\b|\bс\b', re.IGNORECASE)
+
+# Часть запроса, которую использовал dateutil, состоит только из чисел
+_DIGITS_ONLY_RE = re.compile(r'[\d\s]*')
+
+# Специальные периоды - альтернативы одной регулярки с именованными группами
+_SPECIAL_CASE_RE = re.compile('|'.join(
+    f'(?P<{key}>{_RAW_PATTERNS[key]})' for key in SPECIAL_CASE_KEYS
+))
+
+# Месяцы для конвертации: все формы, которые захватывает date_words,
+# поэтому номер месяца - один поиск в словаре
+_MONTH_FORMS = (
+    ('январь', 'января'), ('февраль', 'февраля'), ('март', 'марта'),
+    ('апрель', 'апреля'), ('май', 'мая'), ('июнь', 'июня'),
+    ('июль', 'июля'), ('август', 'августа'), ('сентябрь', 'сентября'),
+    ('октябрь', 'октября'), ('ноябрь', 'ноября'), ('декабрь', 'декабря'),
+)
+_MONTHS = {word: num for num, forms in enumerate(_MONTH_FORMS, 1) for word in forms}
+
+
+_DAYS_IN_MONTH = (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+
+def _days_in_month(year: int, month: int) -> int:
+    """Число дней в месяце по таблице, с поправкой на високосный февраль"""
+    return _DAYS_IN_MONTH[month - 1] + (month == 2 and calendar.isleap(year))
+
+
+# Разделители дат приводятся к точке одним проходом str.translate
+_NORM = str.maketrans('/-', '..')
+
+
+def _normalize(query: str) -> str:
+    """Запрос для регулярок: нижний регистр, без краевых пробелов, '.' в датах"""
+    return query.lower().strip().translate(_NORM)
+
+
+PARSE_CACHE_SIZE = 1024  # Разобранных запросов в кэше одного парсера
 
 
 class RussianDateParser:
@@ -12,99 +135,113 @@ class RussianDateParser:
     def __init__(self, reference_date: datetime = None):
         self.now = reference_date or datetime.now()
         self.today = self.now.date()
-
-        # ОСНОВНЫЕ РЕГУЛЯРКИ (95% покрытие)
-        self.patterns = {
-            # 1. Абсолютные даты (01.01.2024, 1 января 2024)
-            'date_dmy': r'(\d{1,2})[\.\/\-](\d{1,2})[\.\/\-](\d{4})',
-            'date_ymd': r'(\d{4})[\.\/\-](\d{1,2})[\.\/\-](\d{1,2})',
-            'date_words': r'(\d{1,2})\s+(январ[ья]|феврал[ья]|март[а]?|апрел[ья]|ма[йя]|июн[ья]|июл[ья]|август[а]?|сентябр[ья]|октябр[ья]|ноябр[ья]|декабр[ья])\s+(\d{4})',
-
-            # 2. Относительные периоды (последние N единиц)
-            'last_n_days': r'последни[ех]?\s*(\d+)\s*дн(?:ей|я|ю)?\b',
-            'last_n_weeks': r'последни[ех]?\s*(\d+)\s*недел[ьию]?\b',
-            'last_n_months': r'последни[ех]?\s*(\d+)\s*месяц(?:ев|а|е)?\b',
-            'last_n_years': r'последни[ех]?\s*(\d+)\s*год(?:ов|а|у)?\b',
-            'last_n_hours': r'последни[ех]?\s*(\d+)\s*час(?:ов|а)?\b',
-
-            # 3. Специальные периоды
-            'today': r'\bсегодн[яя]\b',
-            'yesterday': r'\bвчера\b',
-            'tomorrow': r'\bзавтра\b',
-            'this_week': r'\bна\s*этой\s*недел[еи]\b',
-            'last_week': r'\bна\s*прошлой\s*недел[еи]\b',
-            'next_week': r'\bна\s*следующей\s*недел[еи]\b',
-            'this_month': r'\bв\s*этом\s*месяц[ее]\b',
-            'last_month': r'\bв\s*прошлом\s*месяц[ее]\b',
-            'next_month': r'\bв\s*следующем\s*месяц[ее]\b',
-            'this_year': r'\bв\s*этом\s*год[уу]\b',
-            'last_year': r'\bв?\s*прошлом\s*год[уу]\b',
-            'next_year': r'\bв?\s*следующем\s*год[уу]\b',
-
-            # 4. Кварталы
-            'quarter': r'(\d+)-?[ыи]?\s*квартал\s*(\d{4})?',
-            'last_quarter': r'последни[ей]?\s*квартал',
-
-            # 5. Сложные комбинации (ваш случай!)
-            'last_n_of_year': r'последни[ех]?\s*(\d+)\s*месяц(?:ев|а|е)?\s*(прошлого|текущего|этого)\s+год[ау]?\b',
-            'first_n_of_year': r'первы[ех]?\s*(\d+)\s*месяц(?:ев|а|е)?\s*(прошлого|текущего|этого)\s+год[ау]?\b',
-
-            # 6. Периоды "с ... по ..."
-            'from_to': r'с\s+(.+?)\s+по\s+(.+)',
-            'between': r'между\s+(.+?)\s+и\s+(.+)',
-
-            # 7. Без точной даты
-            'recently': r'\bнедавно\b|\bна\s*днях\b',
-            'lately': r'\bв\s*последнее\s*время\b',
-            'in_past': r'\bв\s*прошлом\b',
-        }
-
-        # Месяцы для конвертации
-        self.months = {
-            'январ': 1, 'феврал': 2, 'март': 3,
-            'апрел': 4, 'май': 5, 'мая': 5, 'июн': 6,
-            'июл': 7, 'август': 8, 'сентябр': 9,
-            'октябр': 10, 'ноябр': 11, 'декабр': 12
-        }
+        # Даты специальных периодов зависят только от today - считаются один раз
+        self._special_periods = self._build_special_periods()
+        # Результаты разбора по (запрос, опорная дата), вытесняется давно не использованный
+        self._cache = OrderedDict()
 
     def parse_query(self, query: str) -> Dict:
         """Основной метод парсинга запроса"""
-        query_lower = query.lower().strip()
-        original_query = query
-
-        print(f"🔍 Парсим запрос: '{query}'")
+        result = self._cached(query)
+        if result is None:
+            result = self._parse_query(query)
+            self._remember(query, result)
+
+        # Копия, чтобы изменения у вызывающего не попали в кэш
+        return dict(result)
+
+    def parse_queries(self, queries: List[str]) -> List[Dict]:
+        """Разбор пачки запросов в порядке queries
+
+        Повторы разбираются один раз. Каждый разбор (_parse_*) проходит по
+        всем еще не распознанным запросам сразу, запросы без ключевых слов
+        отсеиваются одним проходом и идут прямо в dateutil.
+        """
+        parsed = {}
+        todo = []
+        for query in dict.fromkeys(queries):
+            hit = self._cached(query)
+            if hit is None:
+                todo.append(query)
+            else:
+                parsed[query] = hit
+
+        lowered = [_normalize(query) for query in todo]
+        pending = [i for i, hit in enumerate(map(_TRIGGER_RE.search, lowered)) if hit]
+        results = [None] * len(todo)
+
+        for parse in (self._parse_complex_combinations, self._parse_standard_periods,
+                      self._parse_absolute_dates):
+            unmatched = []
+            for i in pending:
+                results[i] = parse(lowered[i])
+                if results[i] is None:
+                    unmatched.append(i)
+            pending = unmatched
+
+        for query, result in zip(todo, results):
+            parsed[query] = result or self._parse_fallback(query)
+            self._remember(query, parsed[query])
+
+        return [dict(parsed[query]) for query in queries]
+
+    def _cached(self, query: str) -> Optional[Dict]:
+        """Результат из кэша; найденный запрос становится самым свежим"""
+        key = (query, self.now)
+        result = self._cache.get(key)
+        if result is not None:
+            self._cache.move_to_end(key)
+        return result
+
+    def _remember(self, query: str, result: Dict):
+        """Кладет результат в кэш, вытесняя давно не использованный при переполнении"""
+        if len(self._cache) >= PARSE_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        self._cache[(query, self.now)] = result
+
+    def _parse_query(self, query: str) -> Dict:
+        """Разбор запроса без кэша"""
+        query_lower = _normalize(query)
+
+        logger.debug("🔍 Парсим запрос: '%s'", query)
+
+        # Без ключевых слов и цифр ни одна регулярка не сработает - сразу к dateutil
+        if _TRIGGER_RE.search(query_lower):
+            # Сначала пробуем сложные комбинации
+            result = self._parse_complex_combinations(query_lower)
+            if result:
+                logger.debug("   ✅ Распознано как сложный паттерн: %s", result['description'])
+                return result
 
-        # Сначала пробуем сложные комбинации
-        result = self._parse_complex_combinations(query_lower)
-        if result:
-            print(f"   ✅ Распознано как сложный паттерн: {result['description']}")
-            return result
+            # Затем стандартные периоды
+            result = self._parse_standard_periods(query_lower)
+            if result:
+                logger.debug("   ✅ Распознано как стандартный период: %s", result['description'])
+                return result
 
-        # Затем стандартные периоды
-        result = self._parse_standard_periods(query_lower)
-        if result:
-            print(f"   ✅ Распознано как стандартный период: {result['description']}")
-            return result
+            # Абсолютные даты
+            result = self._parse_absolute_dates(query_lower)
+            if result:
+                logger.debug("   ✅ Распознаны абсолютные даты: %s", result['description'])
+                return result
 
-        # Абсолютные даты
-        result = self._parse_absolute_dates(query_lower)
-        if result:
-            print(f"   ✅ Распознаны абсолютные даты: {result['description']}")
-            return result
+        return self._parse_fallback(query)
 
+    def _parse_fallback(self, query: str) -> Dict:
+        """Запрос, который не распознали регулярки: dateutil или 'unclear'"""
         # Fallback: dateutil для всего остального
         result = self._try_dateutil(query)
         if result:
-            print(f"   ⚠️  Распознано dateutil: {result['description']}")
+            logger.debug("   ⚠️  Распознано dateutil: %s", result['description'])
             return result
 
-        print(f"   ❌ Не удалось распознать период")
+        logger.debug("   ❌ Не удалось распознать период")
         return {
             'type': 'unclear',
             'start': None,
             'end': None,
             'description': 'Не удалось распознать период',
-            'original_query': original_query,
+            'original_query': query,
             'confidence': 0
         }
 
@@ -112,7 +249,7 @@ class RussianDateParser:
         """Парсинг сложных комбинаций типа 'последние 6 месяцев прошлого года'"""
 
         # 1. Последние N месяцев прошлого/этого года
-        match = re.search(self.patterns['last_n_of_year'], query)
+        match = _PATTERNS['last_n_of_year'].search(query)
         if match:
             n_months = int(match.group(1))
             year_type = match.group(2)  # 'прошлого', 'текущего', 'этого'
@@ -132,7 +269,7 @@ class RussianDateParser:
                 }
 
         # 2. Первые N месяцев года
-        match = re.search(self.patterns['first_n_of_year'], query)
+        match = _PATTERNS['first_n_of_year'].search(query)
         if match:
             n_months = int(match.group(1))
             year_type = match.group(2)
@@ -140,8 +277,7 @@ class RussianDateParser:
             if year_type == 'прошлого':
                 year = self.now.year - 1
                 start_date = datetime(year, 1, 1)
-                end_date = datetime(year, n_months, 1) + timedelta(days=32)
-                end_date = end_date.replace(day=1) - timedelta(days=1)
+                end_date = datetime(year, n_months, _days_in_month(year, n_months))
 
                 return {
                     'type': 'first_n_months_of_year',
@@ -152,15 +288,15 @@ class RussianDateParser:
                 }
 
         # 3. Период "с ... по ..."
-        match = re.search(self.patterns['from_to'], query)
-        if match:
-            date1_str, date2_str = match.groups()
-            date1 = self._parse_single_date(date1_str.strip())
-            date2 = self._parse_single_date(date2_str.strip())
+        parts = self._split_range(query, 'from_to')
+        if parts:
+            date1_str, date2_str = parts
+            date1 = self._parse_single_date(date1_str)
+            date2 = self._parse_single_date(date2_str)
 
             if date1 and date2:
                 # Убедимся, что date1 <= date2
-                start_date, end_date = sorted([date1, date2])
+                start_date, end_date = (date1, date2) if date1 <= date2 else (date2, date1)
 
                 return {
                     'type': 'from_to',
@@ -172,73 +308,79 @@ class RussianDateParser:
 
         return None
 
+    def _split_range(self, query: str, kind: str) -> Optional[Tuple[str, str]]:
+        """Две части периода 'с X по Y' / 'между X и Y' за два линейных поиска"""
+        start = _PATTERNS[kind].search(query)
+        if not start:
+            return None
+        sep = _PATTERNS[f'{kind}_sep'].search(query, start.end())
+        if not sep:
+            return None
+        left = query[start.end():sep.start()].strip()
+        right = query[sep.end():].strip()
+        if not left or not right:
+            return None
+        return left, right
+
     def _parse_standard_periods(self, query: str) -> Optional[Dict]:
         """Парсинг стандартных относительных периодов"""
 
-        # Последние N дней/недель/месяцев/лет
-        patterns = [
-            ('last_n_days', 'days'),
-            ('last_n_weeks', 'weeks'),
-            ('last_n_months', 'months'),
-            ('last_n_years', 'years'),
-        ]
+        # Последние N дней/недель/месяцев/лет - один проход по запросу
+        match = _PATTERNS['last_n'].search(query)
+        if match:
+            n = int(match.group('n'))
+            unit, to_delta = LAST_N_UNITS[match.lastgroup]
 
-        for pattern_key, unit in patterns:
-            match = re.search(self.patterns[pattern_key], query)
-            if match:
-                n = int(match.group(1))
-                end_date = self.now
-
-                if unit == 'days':
-                    start_date = self.now - timedelta(days=n)
-                elif unit == 'weeks':
-                    start_date = self.now - timedelta(weeks=n)
-                elif unit == 'months':
-                    start_date = self.now - timedelta(days=30 * n)  # Приблизительно
-                elif unit == 'years':
-                    start_date = self.now - timedelta(days=365 * n)
+            return {
+                'type': f'last_{n}_{unit}',
+                'start': self.now - to_delta(n),
+                'end': self.now,
+                'description': f'Последние {n} {self._get_unit_name(n, unit)}',
+                'confidence': 0.9
+            }
 
-                return {
-                    'type': f'last_{n}_{unit}',
-                    'start': start_date,
-                    'end': end_date,
-                    'description': f'Последние {n} {self._get_unit_name(n, unit)}',
-                    'confidence': 0.9
-                }
+        # Специальные периоды: одна регулярка, период - по имени сработавшей группы
+        match = _SPECIAL_CASE_RE.search(query)
+        if match:
+            pattern_key = match.lastgroup
+            start, end, desc = self._special_periods[pattern_key]
+            return {
+                'type': pattern_key,
+                'start': start,
+                'end': end,
+                'description': desc,
+                'confidence': 0.95
+            }
 
-        # Специальные периоды
-        special_cases = {
-            'today': (self.today, self.today, 'Сегодня'),
-            'yesterday': (self.today - timedelta(days=1), self.today - timedelta(days=1), 'Вчера'),
-            'this_week': (self.today - timedelta(days=self.today.weekday()), self.today, 'На этой неделе'),
-            'last_week': (self.today - timedelta(days=self.today.weekday() + 7),
-                          self.today - timedelta(days=self.today.weekday() + 1), 'На прошлой неделе'),
-            'this_month': (datetime(self.today.year, self.today.month, 1),
-                           self.today, 'В этом месяце'),
-            'last_month': (self._first_day_of_month(self.today - timedelta(days=31)),
-                           self._last_day_of_month(self.today - timedelta(days=31)), 'В прошлом месяце'),
-            'this_year': (datetime(self.today.year, 1, 1), self.today, 'В этом году'),
-            'last_year': (datetime(self.today.year - 1, 1, 1),
-                          datetime(self.today.year - 1, 12, 31), 'В прошлом году'),
-        }
+        return None
 
-        for pattern_key, (start, end, desc) in special_cases.items():
-            if re.search(self.patterns[pattern_key], query):
-                return {
-                    'type': pattern_key,
-                    'start': start,
-                    'end': end,
-                    'description': desc,
-                    'confidence': 0.95
-                }
+    def _build_special_periods(self) -> Dict[str, Tuple]:
+        """Границы и описания специальных периодов от self.today"""
+        today = self.today
+        yesterday = today - timedelta(days=1)
+        week_start = today - timedelta(days=today.weekday())
 
-        return None
+        # Предыдущий календарный месяц
+        year, month = divmod(today.year * 12 + today.month - 2, 12)
+        month += 1
+
+        return {
+            'today': (today, today, 'Сегодня'),
+            'yesterday': (yesterday, yesterday, 'Вчера'),
+            'this_week': (week_start, today, 'На этой неделе'),
+            'last_week': (week_start - timedelta(days=7), week_start - timedelta(days=1), 'На прошлой неделе'),
+            'this_month': (datetime(today.year, today.month, 1), today, 'В этом месяце'),
+            'last_month': (date(year, month, 1), date(year, month, _days_in_month(year, month)),
+                           'В прошлом месяце'),
+            'this_year': (datetime(today.year, 1, 1), today, 'В этом году'),
+            'last_year': (datetime(today.year - 1, 1, 1), datetime(today.year - 1, 12, 31), 'В прошлом году'),
+        }
 
     def _parse_absolute_dates(self, query: str) -> Optional[Dict]:
         """Парсинг абсолютных дат"""
 
         # Формат ДД.ММ.ГГГГ
-        match = re.search(self.patterns['date_dmy'], query)
+        match = _PATTERNS['date_dmy'].search(query)
         if match:
             day, month, year = map(int, match.groups())
             date = datetime(year, month, day)
@@ -253,57 +395,59 @@ class RussianDateParser:
             }
 
         # Словарный формат "1 января 2024"
-        match = re.search(self.patterns['date_words'], query)
+        match = _PATTERNS['date_words'].search(query)
         if match:
             day = int(match.group(1))
             month_word = match.group(2)
             year = int(match.group(3))
 
-            # Находим номер месяца
-            month_num = None
-            for month_prefix, num in self.months.items():
-                if month_word.startswith(month_prefix):
-                    month_num = num
-                    break
-
-            if month_num:
-                date = datetime(year, month_num, day)
-                return {
-                    'type': 'single_date_words',
-                    'start': date.replace(hour=0, minute=0, second=0),
-                    'end': date.replace(hour=23, minute=59, second=59),
-                    'description': f'За {day} {month_word} {year} года',
-                    'confidence': 0.98
-                }
+            date = datetime(year, _MONTHS[month_word], day)
+            return {
+                'type': 'single_date_words',
+                'start': date.replace(hour=0, minute=0, second=0),
+                'end': date.replace(hour=23, minute=59, second=59),
+                'description': f'За {day} {month_word} {year} года',
+                'confidence': 0.98
+            }
 
         return None
 
     def _parse_single_date(self, date_str: str) -> Optional[datetime]:
         """Парсинг одиночной даты из строки"""
         # Пробуем разные форматы
-        for pattern in [self.patterns['date_dmy'], self.patterns['date_words']]:
-            match = re.search(pattern, date_str)
+        for pattern in [_PATTERNS['date_dmy'], _PATTERNS['date_words']]:
+            match = pattern.search(date_str)
             if match:
-                if pattern == self.patterns['date_dmy']:
+                if pattern is _PATTERNS['date_dmy']:
                     day, month, year = map(int, match.groups())
                     return datetime(year, month, day)
                 else:
                     day = int(match.group(1))
-                    month_word = match.group(2)
                     year = int(match.group(3))
-                    for prefix, num in self.months.items():
-                        if month_word.startswith(prefix):
-                            return datetime(year, num, day)
+                    return datetime(year, _MONTHS[match.group(2)], day)
         return None
 
     def _try_dateutil(self, query: str) -> Optional[Dict]:
         """Fallback через dateutil"""
         try:
-            # Пробуем распознать как период
-            if 'по' in query or 'с' in query:
+            # Пробуем распознать как период: отдельные слова "с"/"по", а не буквы
+            # внутри слов ("спасибо")
+            if _FROM_TO_CHECK.search(query):
                 return None  # Пропускаем, т.к. это уже обработано
 
-            result = parser.parse(query, fuzzy=True)
+            # Недостающие поля даты берутся из опорной даты парсера, а не из
+            # текущих часов
+            default = self.now.replace(hour=0, minute=0, second=0, microsecond=0)
+            result, skipped = parser.parse(query, fuzzy_with_tokens=True, default=default)
+
+            # Из запроса взято только число ("последний 1 день" -> "1"):
+            # это не дата, а день месяца, угаданный dateutil
+            used = query
+            for token in skipped:
+                used = used.replace(token, ' ', 1)
+            if _DIGITS_ONLY_RE.fullmatch(used):
+                return None
+
             if result:
                 return {
                     'type': 'dateutil',
@@ -312,7 +456,7 @@ class RussianDateParser:
                     'description': f'За {result.strftime("%d.%m.%Y")}',
                     'confidence': 0.7
                 }
-        except:
+        except (ValueError, OverflowError, TypeError):
             pass
         return None
 
@@ -332,13 +476,12 @@ class RussianDateParser:
                 return 'месяца'
             else:
                 return 'месяцев'
+        elif unit == 'hours':
+            if n % 10 == 1 and n % 100 != 11:
+                return 'час'
+            elif 2 <= n % 10 <= 4 and (n % 100 < 10 or n % 100 >= 20):
+                return 'часа'
+            else:
+                return 'часов'
         # ... аналогично для других единиц
-        return unit
-
-    def _first_day_of_month(self, date):
-        return date.replace(day=1)
-
-    def _last_day_of_month(self, date):
-        if date.month == 12:
-            return date.replace(day=31)
-        return date.replace(month=date.month + 1, day=1) - timedelta(days=1)
\ No newline at end of file
+        return unit
\ No newline at end of file
@@ -1,14 +1,46 @@
-import librosa
-
 import os
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
 import soundfile as sf
-from pydub import AudioSegment
+import soxr
 
 
 def quick_check(file_path):
-    """Быстрая проверка частоты файла"""
-    y, sr = librosa.load(file_path, sr=None)
-    return sr
+    """Быстрая проверка частоты файла (читается только заголовок)"""
+    try:
+        return sf.info(file_path).samplerate
+    except RuntimeError:
+        # libsndfile не знает формат (m4a, aac) - спрашиваем ffprobe
+        probe = subprocess.run(
+            ['ffprobe', '-v', 'error', '-select_streams', 'a:0',
+             '-show_entries', 'stream=sample_rate', '-of', 'default=noprint_wrappers=1:nokey=1',
+             file_path],
+            capture_output=True, text=True, check=True
+        )
+        return int(probe.stdout.strip())
+
+
+def is_converted(audio_path, output_path):
+    """Есть ли актуальный 16 кГц файл от прошлого запуска"""
+    if not os.path.exists(output_path) or os.path.getmtime(output_path) < os.path.getmtime(audio_path):
+        return False
+    try:
+        return sf.info(output_path).samplerate == 16000
+    except RuntimeError:
+        return False  # Недописанный или битый файл - конвертируем заново
+
+
+def convert_with_ffmpeg(audio_path, output_path):
+    """Конвертация одним вызовом ffmpeg (форматы, которые не читает soundfile)"""
+    # Для не-mp3 путь совпадает с исходным: ffmpeg не может писать в свой
+    # же вход, поэтому пишем рядом и подменяем файл
+    target_path = output_path + '.tmp.wav' if output_path == audio_path else output_path
+    subprocess.run(
+        ['ffmpeg', '-v', 'error', '-y', '-i', audio_path, '-ar', '16000', '-ac', '1', target_path],
+        check=True
+    )
+    if target_path != output_path:
+        os.replace(target_path, output_path)
 
 
 def ensure_16k(audio_path, output_path=None):
@@ -17,6 +49,11 @@ def ensure_16k(audio_path, output_path=None):
     if output_path is None:
         output_path = audio_path.replace('.mp3', '_16k.wav')
 
+    # Результат прошлого запуска новее исходника и уже 16 кГц - ничего не делаем
+    if is_converted(audio_path, output_path):
+        print(f"✅ Уже сконвертирован: {output_path}")
+        return output_path
+
     # Проверяем текущую частоту
     sr = quick_check(audio_path)
 
@@ -26,10 +63,16 @@ def ensure_16k(audio_path, output_path=None):
     else:
         print(f"🔄 Конвертируем из {sr} Hz в 16000 Hz...")
 
-        # Конвертируем
-        audio = AudioSegment.from_file(audio_path)
-        audio = audio.set_frame_rate(16000).set_channels(1)
-        audio.export(output_path, format="wav")
+        try:
+            # Декодируем в память и ресемплируем soxr (SIMD-ядра SoX) без ffmpeg
+            data, file_sr = sf.read(audio_path, dtype='float32')
+        except RuntimeError:
+            convert_with_ffmpeg(audio_path, output_path)
+        else:
+            if data.ndim > 1:
+                data = data.mean(axis=1)  # в моно
+            data = soxr.resample(data, file_sr, 16000, quality='HQ')
+            sf.write(output_path, data, 16000, subtype='PCM_16')
 
         # Проверяем результат
         new_sr = quick_check(output_path)
@@ -38,5 +81,7 @@ def ensure_16k(audio_path, output_path=None):
 
 
 if __name__=='__main__':
-    for filename in os.listdir('audio_pool'):
-        converted_file = ensure_16k(os.path.join('audio_pool', filename))
\ No newline at end of file
+    # Файлы независимы - конвертируем параллельно на всех ядрах
+    files = [os.path.join('audio_pool', filename) for filename in os.listdir('audio_pool')]
+    with ProcessPoolExecutor() as executor:
+        converted_files = list(executor.map(ensure_16k, files))
\ No newline at end of file